@@ -0,0 +1,687 @@
+''' Stateful, offline stand-in for the autoscaling, elb, elbv2, ec2 and sqs
+    clients used by ec2_asg. Time is virtual: the simulator owns a clock that
+    replaces the module's time, so a 90 minute rolling update runs in well
+    under a second while still reporting how long it would have taken. '''
+import itertools
+import json
+import threading
+import time as _time
+
+import botocore.exceptions
+
+
+class VirtualClock(object):
+    ''' Drop-in for the time module. sleep advances the clock instead of
+        blocking and lets the simulated world catch up. '''
+
+    def __init__(self, start=1500000000.0):
+        self.now = start
+        self.slept = 0.0
+        self.listeners = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+        for listener in self.listeners:
+            listener()
+
+    def asctime(self, t=None):
+        return _time.asctime(_time.gmtime(self.now if t is None else t))
+
+    def __getattr__(self, name):
+        return getattr(_time, name)
+
+
+def client_error(code, operation, message=''):
+    return botocore.exceptions.ClientError({'Error': {'Code': code, 'Message': message or code}}, operation)
+
+
+LAUNCH_KEYS = ('LaunchConfigurationName', 'LaunchTemplate', 'MixedInstancesPolicy')
+
+
+def weight(instance):
+    return int(instance.get('WeightedCapacity') or 1)
+
+
+class World(object):
+    ''' Shared AWS state behind the simulated clients. '''
+
+    def __init__(self, clock, boot_seconds=60, healthy_seconds=30, drain_seconds=20, terminate_seconds=30,
+                 call_seconds=0.05, calls_per_second=None, burst=None, warm_start_seconds=10):
+        ''' boot_seconds is how long a launched instance stays Pending,
+            healthy_seconds how much longer its load balancers take to find
+            it healthy, drain_seconds how long a deregistered instance drains
+            and terminate_seconds how long it stays Terminating. An instance
+            taken from a warm pool is Pending for warm_start_seconds. Every API
+            call takes call_seconds, and with calls_per_second set each
+            service throttles beyond that rate once burst calls are used up. '''
+        self.clock = clock
+        self.call_seconds = call_seconds
+        self.boot_seconds = boot_seconds
+        self.healthy_seconds = healthy_seconds
+        self.drain_seconds = drain_seconds
+        self.terminate_seconds = terminate_seconds
+        self.warm_start_seconds = warm_start_seconds
+        self.calls_per_second = calls_per_second
+        self.burst = burst or calls_per_second
+        self.tokens = {}
+        self.refilled = {}
+        self.groups = {}
+        self.instances = {}
+        self.launch_configs = {}
+        self.launch_templates = {}
+        self.load_balancers = {}
+        self.target_groups = {}
+        self.zones = ['us-east-1a', 'us-east-1b', 'us-east-1c']
+        self.queues = {}
+        self.subscriptions = {}
+        self.calls = {}
+        self.throttled = 0
+        self.ids = itertools.count(1)
+        # the module calls from several threads at once, the world changes under one lock
+        self.lock = threading.RLock()
+        clock.listeners.append(self.step)
+
+    # setup helpers
+    def add_launch_config(self, name):
+        self.launch_configs[name] = {'LaunchConfigurationName': name}
+
+    def add_launch_template(self, name):
+        self.launch_templates['lt-%08x' % (len(self.launch_templates) + 1)] = name
+
+    def launch_template(self, spec):
+        ''' spec as AWS reports it back, with both the id and the name. '''
+        for template_id, name in self.launch_templates.items():
+            if (spec.get('LaunchTemplateId') == template_id or spec.get('LaunchTemplateName') == name):
+                return {'LaunchTemplateId': template_id, 'LaunchTemplateName': name,
+                        'Version': spec.get('Version', '$Default')}
+        raise client_error('ValidationError', 'CreateAutoScalingGroup', 'launch template not found')
+
+    def set_launch(self, group, kwargs):
+        ''' Points group at the launch configuration, launch template or
+            mixed instances policy among kwargs, dropping the others. '''
+        launch = dict((key, kwargs[key]) for key in LAUNCH_KEYS if kwargs.get(key))
+        if (not launch):
+            return
+        if ('LaunchTemplate' in launch):
+            launch['LaunchTemplate'] = self.launch_template(launch['LaunchTemplate'])
+        if ('MixedInstancesPolicy' in launch):
+            policy = json.loads(json.dumps(launch['MixedInstancesPolicy']))
+            template = policy['LaunchTemplate']
+            template['LaunchTemplateSpecification'] = self.launch_template(template['LaunchTemplateSpecification'])
+            launch['MixedInstancesPolicy'] = policy
+        for key in LAUNCH_KEYS:
+            group.pop(key, None)
+        group.update(launch)
+
+    def add_load_balancer(self, name):
+        self.load_balancers.setdefault(name, {})
+
+    def add_target_group(self, arn):
+        self.target_groups.setdefault(arn, {})
+
+    def add_queue(self, url, topics=()):
+        ''' An SQS queue, subscribed to the SNS topics given. '''
+        self.queues.setdefault(url, [])
+        for topic in topics:
+            self.subscriptions.setdefault(topic, []).append(url)
+
+    def add_group(self, name, launch_config_name, size, load_balancers=(), target_groups=(), health_check_type='ELB',
+                  zones=None):
+        if (launch_config_name):
+            self.add_launch_config(launch_config_name)
+        for lb in load_balancers:
+            self.load_balancers.setdefault(lb, {})
+        for tg in target_groups:
+            self.target_groups.setdefault(tg, {})
+        self.groups[name] = {
+            'AutoScalingGroupName': name,
+            'AutoScalingGroupARN': 'arn:aws:autoscaling:us-east-1:123456789012:autoScalingGroup:x:'
+                                   'autoScalingGroupName/%s' % name,
+            'LaunchConfigurationName': launch_config_name,
+            'MinSize': size,
+            'MaxSize': size,
+            'DesiredCapacity': size,
+            'DefaultCooldown': 300,
+            'AvailabilityZones': list(zones or self.zones),
+            'LoadBalancerNames': list(load_balancers),
+            'TargetGroupARNs': list(target_groups),
+            'HealthCheckType': health_check_type,
+            'HealthCheckGracePeriod': 300,
+            'VPCZoneIdentifier': '',
+            'TerminationPolicies': ['Default'],
+            'NewInstancesProtectedFromScaleIn': False,
+            'Tags': [],
+            'Instances': [],
+        }
+        for _ in range(size):
+            self.launch(name, ready=True)
+
+    # simulation
+    def launch(self, group_name, ready=False, warm=False):
+        ''' Launches an instance into the group, or into its warm pool. '''
+        group = self.groups[group_name]
+        counts = dict((z, 0) for z in group['AvailabilityZones'])
+        for i in self.members(group_name):
+            counts[i['AvailabilityZone']] = counts.get(i['AvailabilityZone'], 0) + 1
+        zone = sorted(counts, key=lambda z: (counts[z], z))[0]
+        instance_id = 'i-%08x' % next(self.ids)
+        now = self.clock.time()
+        self.instances[instance_id] = {
+            'InstanceId': instance_id,
+            'group': group_name,
+            'AvailabilityZone': zone,
+            'LifecycleState': 'Warmed:Pending' if warm else 'InService' if ready else 'Pending',
+            'HealthStatus': 'Healthy',
+            'ProtectedFromScaleIn': False,
+            'in_service_at': now if ready else now + self.boot_seconds,
+            'healthy_at': now if ready else now + self.boot_seconds + self.healthy_seconds,
+            'gone_at': None,
+        }
+        if (group.get('LaunchConfigurationName')):
+            self.instances[instance_id]['LaunchConfigurationName'] = group['LaunchConfigurationName']
+        elif (group.get('LaunchTemplate')):
+            self.instances[instance_id]['LaunchTemplate'] = dict(group['LaunchTemplate'])
+        else:
+            # the first override, as the prioritized allocation strategy picks it
+            template = group['MixedInstancesPolicy']['LaunchTemplate']
+            self.instances[instance_id]['LaunchTemplate'] = dict(template['LaunchTemplateSpecification'])
+            if (template.get('Overrides')):
+                self.instances[instance_id]['InstanceType'] = template['Overrides'][0]['InstanceType']
+                if (template['Overrides'][0].get('WeightedCapacity')):
+                    self.instances[instance_id]['WeightedCapacity'] = template['Overrides'][0]['WeightedCapacity']
+        if (warm):
+            return instance_id
+        self.register(group, instance_id)
+        return instance_id
+
+    def start_warm(self, group_name):
+        ''' Brings a warmed instance of the group's pool into the group,
+            returning its id, or None when none is ready. '''
+        group = self.groups[group_name]
+        for instance in sorted(self.pool(group_name), key=lambda x: x['InstanceId']):
+            if (instance['LifecycleState'] in ('Warmed:Stopped', 'Warmed:Running', 'Warmed:Hibernated')):
+                now = self.clock.time()
+                instance['LifecycleState'] = 'Pending'
+                instance['in_service_at'] = now + self.warm_start_seconds
+                instance['healthy_at'] = now + self.warm_start_seconds + self.healthy_seconds
+                self.register(group, instance['InstanceId'])
+                return instance['InstanceId']
+        return None
+
+    def register(self, group, instance_id):
+        for lb in group['LoadBalancerNames']:
+            self.load_balancers[lb][instance_id] = None
+        for tg in group['TargetGroupARNs']:
+            self.target_groups[tg][instance_id] = None
+
+    def notify(self, group_name, event, instance_id):
+        group = self.groups.get(group_name)
+        if (group is None):
+            return
+        message = json.dumps({'AutoScalingGroupName': group_name, 'Event': event, 'EC2InstanceId': instance_id})
+        for topic, types in group.get('notifications', {}).items():
+            if (event in types):
+                for url in self.subscriptions.get(topic, ()):
+                    self.queues[url].append(json.dumps({'TopicArn': topic, 'Message': message}))
+
+    def members(self, group_name, warm=False):
+        ''' The instances of the group, with warm those of its warm pool too. '''
+        return [i for i in self.instances.values()
+                if i['group'] == group_name and (warm or not i['LifecycleState'].startswith('Warmed:'))]
+
+    def pool(self, group_name):
+        return [i for i in self.members(group_name, warm=True) if i['LifecycleState'].startswith('Warmed:')]
+
+    def step(self):
+        with self.lock:
+            self._step()
+
+    def _step(self):
+        now = self.clock.time()
+        for instance_id, i in list(self.instances.items()):
+            if (i['LifecycleState'] == 'Pending' and i['in_service_at'] <= now):
+                i['LifecycleState'] = 'InService'
+                self.notify(i['group'], 'autoscaling:EC2_INSTANCE_LAUNCH', instance_id)
+            if (i['LifecycleState'] == 'Warmed:Pending' and i['in_service_at'] <= now):
+                pool = self.groups[i['group']].get('WarmPoolConfiguration') or {}
+                i['LifecycleState'] = 'Warmed:' + pool.get('PoolState', 'Stopped')
+            if (i['gone_at'] is not None and i['gone_at'] <= now):
+                del self.instances[instance_id]
+                self.notify(i['group'], 'autoscaling:EC2_INSTANCE_TERMINATE', instance_id)
+                for registrations in itertools.chain(self.load_balancers.values(), self.target_groups.values()):
+                    registrations.pop(instance_id, None)
+        for registrations in itertools.chain(self.load_balancers.values(), self.target_groups.values()):
+            for instance_id, drained_at in list(registrations.items()):
+                if (drained_at is not None and drained_at <= now):
+                    del registrations[instance_id]
+        for group_name, group in self.groups.items():
+            group['peak_capacity'] = max(group.get('peak_capacity', 0), group['DesiredCapacity'])
+            live = [i for i in self.members(group_name) if not i['LifecycleState'].startswith('Terminating')]
+            capacity = sum(weight(i) for i in live)
+            # desired capacity is in weight units, launches may overshoot it
+            while (capacity < group['DesiredCapacity']):
+                instance_id = self.start_warm(group_name) or self.launch(group_name)
+                capacity += weight(self.instances[instance_id])
+            for i in sorted(live, key=lambda x: x['InstanceId']):
+                if (capacity - weight(i) < group['DesiredCapacity']):
+                    break
+                self.terminate(i)
+                capacity -= weight(i)
+            self.refill(group_name, group)
+
+    def refill(self, group_name, group):
+        ''' Keeps the warm pool of the group at its size: what the group may
+            prepare beyond its desired capacity, but at least MinSize. '''
+        pool = group.get('WarmPoolConfiguration')
+        if (not pool):
+            return
+        warm = [i for i in self.pool(group_name) if i['LifecycleState'] != 'Warmed:Terminating']
+        if (pool.get('Status') == 'PendingDelete'):
+            if (not self.pool(group_name)):
+                del group['WarmPoolConfiguration']
+            return
+        prepared = pool.get('MaxGroupPreparedCapacity', -1)
+        if (prepared is None or prepared < 0):
+            prepared = group['MaxSize']
+        size = max(pool.get('MinSize', 0), prepared - group['DesiredCapacity'])
+        for _ in range(size - len(warm)):
+            self.launch(group_name, warm=True)
+
+    def terminate(self, instance):
+        if (instance['LifecycleState'].startswith('Warmed:')):
+            if (instance['LifecycleState'] != 'Warmed:Terminating'):
+                instance['LifecycleState'] = 'Warmed:Terminating'
+                instance['gone_at'] = self.clock.time() + self.terminate_seconds
+            return
+        if (not instance['LifecycleState'].startswith('Terminating')):
+            instance['LifecycleState'] = 'Terminating'
+            instance['gone_at'] = self.clock.time() + self.terminate_seconds
+
+    def lb_state(self, registrations, instance_id):
+        if (instance_id not in registrations):
+            return None
+        if (registrations[instance_id] is not None):
+            return 'draining'
+        instance = self.instances.get(instance_id)
+        if (instance and instance['healthy_at'] <= self.clock.time() and instance['LifecycleState'] == 'InService'):
+            return 'healthy'
+        return 'unhealthy'
+
+    def record(self, service, operation):
+        key = '%s.%s' % (service, operation)
+        self.calls[key] = self.calls.get(key, 0) + 1
+        self.clock.now += self.call_seconds
+        if (self.calls_per_second):
+            now = self.clock.time()
+            tokens = self.tokens.get(service, self.burst)
+            tokens = min(self.burst, tokens + (now - self.refilled.get(service, now)) * self.calls_per_second)
+            self.refilled[service] = now
+            if (tokens < 1):
+                self.tokens[service] = tokens
+                self.throttled += 1
+                raise client_error('Throttling', operation, 'Rate exceeded')
+            self.tokens[service] = tokens - 1
+        self.step()
+
+    def api_calls(self):
+        return sum(self.calls.values())
+
+
+class FakeClient(object):
+    service = None
+
+    def __init__(self, world):
+        self.world = world
+
+    def __getattribute__(self, name):
+        attr = object.__getattribute__(self, name)
+        if (name.startswith('_') or name in ('world', 'service') or not callable(attr)):
+            return attr
+
+        def call(*args, **kwargs):
+            with self.world.lock:
+                self.world.record(self.service, name)
+                return attr(*args, **kwargs)
+        return call
+
+
+class FakeAutoscaling(FakeClient):
+    service = 'autoscaling'
+
+    def _describe(self, group):
+        asg = dict((k, v) for k, v in group.items() if k[0].isupper())
+        asg['Instances'] = [dict((k, v) for k, v in i.items() if k[0].isupper())
+                            for i in sorted(self.world.members(group['AutoScalingGroupName']),
+                                            key=lambda x: x['InstanceId'])]
+        asg['LoadBalancerNames'] = list(group['LoadBalancerNames'])
+        asg['TargetGroupARNs'] = list(group['TargetGroupARNs'])
+        asg['Tags'] = [dict(t) for t in group['Tags']]
+        if (group.get('WarmPoolConfiguration')):
+            asg['WarmPoolConfiguration'] = dict(group['WarmPoolConfiguration'])
+            asg['WarmPoolSize'] = len(self.world.pool(group['AutoScalingGroupName']))
+        return asg
+
+    def describe_auto_scaling_groups(self, AutoScalingGroupNames=None, MaxRecords=50, NextToken=None):
+        names = AutoScalingGroupNames or sorted(self.world.groups)
+        found = [n for n in names if n in self.world.groups]
+        start = int(NextToken or 0)
+        page = found[start:start + MaxRecords]
+        result = {'AutoScalingGroups': [self._describe(self.world.groups[n]) for n in page]}
+        if (start + MaxRecords < len(found)):
+            result['NextToken'] = str(start + MaxRecords)
+        return result
+
+    def describe_auto_scaling_instances(self, InstanceIds=None, MaxRecords=50, NextToken=None):
+        instances = sorted((i for i in self.world.instances.values() if i['group'] is not None),
+                           key=lambda x: x['InstanceId'])
+        if (InstanceIds):
+            instances = [i for i in instances if i['InstanceId'] in InstanceIds]
+        start = int(NextToken or 0)
+        page = instances[start:start + MaxRecords]
+        result = {'AutoScalingInstances': [dict([(k, v) for k, v in i.items() if k[0].isupper()],
+                                                AutoScalingGroupName=i['group']) for i in page]}
+        if (start + MaxRecords < len(instances)):
+            result['NextToken'] = str(start + MaxRecords)
+        return result
+
+    def describe_launch_configurations(self, LaunchConfigurationNames=()):
+        return {'LaunchConfigurations': [self.world.launch_configs[n] for n in LaunchConfigurationNames
+                                         if n in self.world.launch_configs]}
+
+    def create_auto_scaling_group(self, **kwargs):
+        name = kwargs['AutoScalingGroupName']
+        if (name in self.world.groups):
+            raise client_error('AlreadyExists', 'CreateAutoScalingGroup')
+        self.world.add_group(name, kwargs.get('LaunchConfigurationName'), 0, kwargs.get('LoadBalancerNames', ()),
+                             kwargs.get('TargetGroupARNs', ()), kwargs.get('HealthCheckType', 'EC2'),
+                             kwargs.get('AvailabilityZones'))
+        group = self.world.groups[name]
+        self.world.set_launch(group, kwargs)
+        group['MinSize'] = kwargs['MinSize']
+        group['MaxSize'] = kwargs['MaxSize']
+        group['DesiredCapacity'] = kwargs.get('DesiredCapacity', kwargs['MinSize'])
+        group['Tags'] = [dict(t) for t in kwargs.get('Tags', [])]
+        self.world.step()
+
+    def detach_instances(self, InstanceIds, AutoScalingGroupName, ShouldDecrementDesiredCapacity):
+        group = self.world.groups[AutoScalingGroupName]
+        now = self.world.clock.time()
+        capacity = sum(weight(self.world.instances[instance_id]) for instance_id in InstanceIds)
+        for instance_id in InstanceIds:
+            instance = self.world.instances[instance_id]
+            if (instance['group'] != AutoScalingGroupName):
+                raise client_error('ValidationError', 'DetachInstances', 'not part of the group')
+            instance['group'] = None
+            for lb in group['LoadBalancerNames']:
+                self.world.load_balancers[lb][instance_id] = now + self.world.drain_seconds
+            for tg in group['TargetGroupARNs']:
+                self.world.target_groups[tg][instance_id] = now + self.world.drain_seconds
+        if (ShouldDecrementDesiredCapacity):
+            group['DesiredCapacity'] -= capacity
+        self.world.step()
+
+    def attach_instances(self, InstanceIds, AutoScalingGroupName):
+        group = self.world.groups[AutoScalingGroupName]
+        capacity = sum(weight(self.world.instances[instance_id]) for instance_id in InstanceIds)
+        if (group['DesiredCapacity'] + capacity > group['MaxSize']):
+            raise client_error('ValidationError', 'AttachInstances', 'desired capacity above max size')
+        now = self.world.clock.time()
+        for instance_id in InstanceIds:
+            instance = self.world.instances[instance_id]
+            if (instance['group'] is not None):
+                raise client_error('ValidationError', 'AttachInstances', 'already part of a group')
+            instance['group'] = AutoScalingGroupName
+            # registered afresh, so the load balancers check it again
+            instance['healthy_at'] = max(instance['healthy_at'], now + self.world.healthy_seconds)
+            for lb in group['LoadBalancerNames']:
+                self.world.load_balancers[lb][instance_id] = None
+            for tg in group['TargetGroupARNs']:
+                self.world.target_groups[tg][instance_id] = None
+        group['DesiredCapacity'] += capacity
+        self.world.step()
+
+    def update_auto_scaling_group(self, **kwargs):
+        group = self.world.groups[kwargs['AutoScalingGroupName']]
+        self.world.set_launch(group, kwargs)
+        for key, value in kwargs.items():
+            if (key not in LAUNCH_KEYS):
+                group[key] = value
+        if not (group['MinSize'] <= group['DesiredCapacity'] <= group['MaxSize']):
+            raise client_error('ValidationError', 'UpdateAutoScalingGroup', 'desired capacity out of range')
+        self.world.step()
+
+    def set_desired_capacity(self, AutoScalingGroupName, DesiredCapacity, HonorCooldown=False):
+        self.world.groups[AutoScalingGroupName]['DesiredCapacity'] = DesiredCapacity
+        self.world.step()
+
+    def terminate_instance_in_auto_scaling_group(self, InstanceId, ShouldDecrementDesiredCapacity):
+        instance = self.world.instances.get(InstanceId)
+        if (instance is None):
+            raise client_error('ValidationError', 'TerminateInstanceInAutoScalingGroup', 'Instance Id not found')
+        if (ShouldDecrementDesiredCapacity):
+            self.world.groups[instance['group']]['DesiredCapacity'] -= weight(instance)
+        self.world.terminate(instance)
+        return {'Activity': {'StatusCode': 'InProgress'}}
+
+    def delete_auto_scaling_group(self, AutoScalingGroupName, ForceDelete=False):
+        group = self.world.groups.get(AutoScalingGroupName)
+        members = self.world.members(AutoScalingGroupName, warm=True)
+        if (members and not ForceDelete):
+            raise client_error('ResourceInUse', 'DeleteAutoScalingGroup')
+        for i in members:
+            self.world.terminate(i)
+            i['group'] = None
+        del self.world.groups[AutoScalingGroupName]
+        return group
+
+    def describe_warm_pool(self, AutoScalingGroupName, MaxRecords=50, NextToken=None):
+        group = self.world.groups[AutoScalingGroupName]
+        instances = sorted(self.world.pool(AutoScalingGroupName), key=lambda x: x['InstanceId'])
+        start = int(NextToken or 0)
+        result = {'WarmPoolConfiguration': dict(group['WarmPoolConfiguration']) if group.get('WarmPoolConfiguration')
+                  else None,
+                  'Instances': [dict((k, v) for k, v in i.items() if k[0].isupper())
+                                for i in instances[start:start + MaxRecords]]}
+        if (start + MaxRecords < len(instances)):
+            result['NextToken'] = str(start + MaxRecords)
+        return result
+
+    def put_warm_pool(self, AutoScalingGroupName, **kwargs):
+        group = self.world.groups[AutoScalingGroupName]
+        group['WarmPoolConfiguration'] = dict(kwargs, PoolState=kwargs.get('PoolState', 'Stopped'),
+                                              MinSize=kwargs.get('MinSize', 0))
+        self.world.step()
+
+    def delete_warm_pool(self, AutoScalingGroupName, ForceDelete=False):
+        group = self.world.groups[AutoScalingGroupName]
+        group['WarmPoolConfiguration']['Status'] = 'PendingDelete'
+        for i in self.world.pool(AutoScalingGroupName):
+            self.world.terminate(i)
+        self.world.step()
+
+    def create_or_update_tags(self, Tags):
+        for tag in Tags:
+            group = self.world.groups[tag['ResourceId']]
+            group['Tags'] = [t for t in group['Tags'] if t['Key'] != tag['Key']] + [dict(tag)]
+
+    def delete_tags(self, Tags):
+        for tag in Tags:
+            group = self.world.groups[tag['ResourceId']]
+            group['Tags'] = [t for t in group['Tags'] if t['Key'] != tag['Key']]
+
+    def attach_load_balancers(self, AutoScalingGroupName, LoadBalancerNames):
+        group = self.world.groups[AutoScalingGroupName]
+        for lb in LoadBalancerNames:
+            if (lb not in group['LoadBalancerNames']):
+                group['LoadBalancerNames'].append(lb)
+            registrations = self.world.load_balancers.setdefault(lb, {})
+            for i in self.world.members(AutoScalingGroupName):
+                registrations.setdefault(i['InstanceId'], None)
+
+    def detach_load_balancers(self, AutoScalingGroupName, LoadBalancerNames):
+        group = self.world.groups[AutoScalingGroupName]
+        group['LoadBalancerNames'] = [lb for lb in group['LoadBalancerNames'] if lb not in LoadBalancerNames]
+        for lb in LoadBalancerNames:
+            for i in self.world.members(AutoScalingGroupName):
+                self.world.load_balancers[lb].pop(i['InstanceId'], None)
+
+    def attach_load_balancer_target_groups(self, AutoScalingGroupName, TargetGroupARNs):
+        group = self.world.groups[AutoScalingGroupName]
+        for tg in TargetGroupARNs:
+            if (tg not in group['TargetGroupARNs']):
+                group['TargetGroupARNs'].append(tg)
+            registrations = self.world.target_groups.setdefault(tg, {})
+            for i in self.world.members(AutoScalingGroupName):
+                registrations.setdefault(i['InstanceId'], None)
+
+    def detach_load_balancer_target_groups(self, AutoScalingGroupName, TargetGroupARNs):
+        group = self.world.groups[AutoScalingGroupName]
+        group['TargetGroupARNs'] = [tg for tg in group['TargetGroupARNs'] if tg not in TargetGroupARNs]
+        for tg in TargetGroupARNs:
+            for i in self.world.members(AutoScalingGroupName):
+                self.world.target_groups[tg].pop(i['InstanceId'], None)
+
+    def put_notification_configuration(self, AutoScalingGroupName, TopicARN, NotificationTypes):
+        self.world.groups[AutoScalingGroupName]['notifications'] = {TopicARN: list(NotificationTypes)}
+
+    def delete_notification_configuration(self, AutoScalingGroupName, TopicARN):
+        group = self.world.groups.get(AutoScalingGroupName)
+        if (group):
+            group.get('notifications', {}).pop(TopicARN, None)
+
+    def describe_notification_configurations(self, AutoScalingGroupNames):
+        configurations = []
+        for name in AutoScalingGroupNames:
+            for topic, types in self.world.groups[name].get('notifications', {}).items():
+                for notification_type in types:
+                    configurations.append({'AutoScalingGroupName': name, 'TopicARN': topic,
+                                           'NotificationType': notification_type})
+        return {'NotificationConfigurations': configurations}
+
+
+class FakeElb(FakeClient):
+    service = 'elb'
+
+    def describe_load_balancers(self, LoadBalancerNames):
+        return {'LoadBalancerDescriptions': [
+            {'LoadBalancerName': n, 'Instances': [{'InstanceId': i} for i in sorted(self.world.load_balancers[n])]}
+            for n in LoadBalancerNames]}
+
+    def deregister_instances_from_load_balancer(self, LoadBalancerName, Instances):
+        registrations = self.world.load_balancers[LoadBalancerName]
+        for instance in Instances:
+            if (instance['InstanceId'] in registrations and registrations[instance['InstanceId']] is None):
+                registrations[instance['InstanceId']] = self.world.clock.time() + self.world.drain_seconds
+        return {'Instances': [{'InstanceId': i} for i in registrations]}
+
+    def describe_instance_health(self, LoadBalancerName, Instances=None):
+        registrations = self.world.load_balancers[LoadBalancerName]
+        if (Instances):
+            ids = [i['InstanceId'] for i in Instances]
+            for instance_id in ids:
+                if (instance_id not in registrations):
+                    raise client_error('InvalidInstance', 'DescribeInstanceHealth')
+        else:
+            ids = sorted(registrations)
+        states = []
+        for instance_id in ids:
+            state = self.world.lb_state(registrations, instance_id)
+            states.append({'InstanceId': instance_id, 'State': 'InService' if state in ('healthy', 'draining')
+                           else 'OutOfService'})
+        return {'InstanceStates': states}
+
+
+class FakeElbv2(FakeClient):
+    service = 'elbv2'
+
+    def describe_target_groups(self, TargetGroupArns):
+        return {'TargetGroups': [{'TargetGroupArn': arn} for arn in TargetGroupArns]}
+
+    def deregister_targets(self, TargetGroupArn, Targets):
+        registrations = self.world.target_groups[TargetGroupArn]
+        for target in Targets:
+            if (target['Id'] in registrations and registrations[target['Id']] is None):
+                registrations[target['Id']] = self.world.clock.time() + self.world.drain_seconds
+        return {}
+
+    def describe_target_health(self, TargetGroupArn, Targets=None):
+        registrations = self.world.target_groups[TargetGroupArn]
+        ids = [t['Id'] for t in Targets] if Targets else sorted(registrations)
+        descriptions = []
+        for instance_id in ids:
+            state = self.world.lb_state(registrations, instance_id) or 'unused'
+            descriptions.append({'Target': {'Id': instance_id, 'Port': 80}, 'TargetHealth': {'State': state}})
+        return {'TargetHealthDescriptions': descriptions}
+
+
+class FakeEc2(FakeClient):
+    service = 'ec2'
+
+    def describe_availability_zones(self):
+        return {'AvailabilityZones': [{'ZoneName': z, 'State': 'available'} for z in self.world.zones]}
+
+
+class FakeSqs(FakeClient):
+    ''' A local queue: long polls advance the virtual clock a second at a
+        time until a message arrives or WaitTimeSeconds pass. '''
+    service = 'sqs'
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, WaitTimeSeconds=0):
+        queue = self.world.queues[QueueUrl]
+        waited = 0
+        while (not queue and waited < WaitTimeSeconds):
+            self.world.clock.sleep(1)
+            waited += 1
+        bodies = queue[:MaxNumberOfMessages]
+        del queue[:MaxNumberOfMessages]
+        return {'Messages': [{'MessageId': str(n), 'ReceiptHandle': 'rh-%d' % n, 'Body': body}
+                             for n, body in enumerate(bodies)]}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        # received messages are already off the queue
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries]}
+
+
+class ModuleFailed(Exception):
+    pass
+
+
+class SimModule(object):
+    ''' Enough of AnsibleModule for the module functions to run unattended.
+        params start from the defaults of the module's argument spec. '''
+
+    def __init__(self, ec2_asg, params, check_mode=False):
+        self.argument_spec = ec2_asg.asg_argument_spec()
+        self.params = {}
+        for name, option in self.argument_spec.items():
+            value = option.get('default')
+            if (option.get('type') == 'list' and isinstance(value, str)):
+                value = value.split(',')
+            self.params[name] = value
+        self.params.update(params)
+        self.check_mode = check_mode
+        self.result = None
+
+    def boolean(self, value):
+        return value in (True, 'yes', 'true', 'True', 1, '1')
+
+    def fail_json(self, **kwargs):
+        raise ModuleFailed(kwargs)
+
+    def exit_json(self, **kwargs):
+        self.result = kwargs
+
+
+def simulate(ec2_asg, **world_options):
+    ''' Points ec2_asg at a fresh virtual clock and returns (world, clients)
+        where clients are the autoscaling, elb, elbv2 and ec2 clients in the
+        order main() builds them. '''
+    clock = VirtualClock()
+    ec2_asg.time = clock
+    world = World(clock, **world_options)
+    clients = (FakeAutoscaling(world), FakeElb(world), FakeElbv2(world), FakeEc2(world))
+    return world, clients
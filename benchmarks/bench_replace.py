@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+''' Measures create_autoscaling_group and replace() against the offline
+    simulator in asg_sim.py. For every combination of group size, batch size
+    and load balancer topology it reports the simulated wall-clock time, the
+    time spent sleeping and the API calls made per operation, so that
+    regressions in the polling paths show up before they reach AWS.
+
+    python benchmarks/bench_replace.py --sizes 10,50 --batches 1,5 --json bench_output.txt
+
+The plan scenario runs replace() in check mode against its in-memory model of
+the group, where only the CPU time matters; --max-cpu-seconds turns a run
+slower than that into an error.
+
+--max-peak-surge turns a replace run into an error if the group ever had more
+than that many instances above its size, e.g. for an adaptive batch mode:
+
+    python benchmarks/bench_replace.py --scenarios replace --sizes 10,20 --batches 1 \
+        --param replace_batch_mode='"adaptive"' --max-peak-surge 10
+
+--interrupt before:N or after:N stops a replace run just before or just after
+its Nth instance termination, as a failed or killed run would, and runs the
+module again to resume it from its checkpoint_file. The run is an error unless
+the group ends up with only new instances in service, at its own size, and no
+instance was terminated twice:
+
+    python benchmarks/bench_replace.py --scenarios replace --sizes 10 --batches 2 --topologies elb \
+        --param replace_pipeline=true --interrupt after:3
+
+With --events notifications the waits for instances read the group's
+notifications from a simulated SQS queue and only poll once they show progress.
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import botocore.exceptions
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asg_sim
+import ec2_asg
+
+TOPOLOGIES = {
+    'none': ((), ()),
+    'elb': (('lb-1',), ()),
+    'tg': ((), ('arn:tg-1',)),
+    'elb+2tg': (('lb-1',), ('arn:tg-1', 'arn:tg-2')),
+    '8tg': ((), tuple('arn:tg-%d' % n for n in range(1, 9))),
+}
+
+EVENT_TOPIC = 'arn:aws:sns:us-east-1:123456789012:bench-events'
+EVENT_QUEUE = 'https://sqs.us-east-1.amazonaws.com/123456789012/bench-events'
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_terminations(asg_connection, when, count):
+    ''' Makes the count-th termination through asg_connection raise
+        Interrupted, once, before it is made or after, and records every
+        termination in the returned list. '''
+    terminate = asg_connection.terminate_instance_in_auto_scaling_group
+    terminated = []
+    interrupted = []
+
+    def terminate_instance_in_auto_scaling_group(**kwargs):
+        if (when == 'before' and len(terminated) + 1 == count and not interrupted):
+            interrupted.append(kwargs['InstanceId'])
+            raise Interrupted()
+        terminated.append(kwargs['InstanceId'])
+        response = terminate(**kwargs)
+        if (when == 'after' and len(terminated) == count):
+            raise Interrupted()
+        return response
+
+    asg_connection.terminate_instance_in_auto_scaling_group = terminate_instance_in_auto_scaling_group
+    return terminated
+
+
+def resume_error(world, size, terminated):
+    ''' What is wrong with the group after a resumed replace, or None. '''
+    group = world.groups['bench']
+    twice = sorted(set(instance_id for instance_id in terminated if terminated.count(instance_id) > 1))
+    if (twice):
+        return 'terminated {0} twice'.format(', '.join(twice))
+    if ((group['MinSize'], group['MaxSize'], group['DesiredCapacity']) != (size, size, size)):
+        return 'resumed to sizes {0}/{1}/{2}'.format(group['MinSize'], group['MaxSize'], group['DesiredCapacity'])
+    members = world.members('bench')
+    left = [i['InstanceId'] for i in members if (i['LifecycleState'] != 'InService' or
+                                                 i.get('LaunchConfigurationName') != 'lc-new')]
+    if (left or len(members) != size):
+        return 'resumed to {0} instances, {1} of them old or not in service'.format(len(members), len(left))
+    return None
+
+
+def run_scenario(scenario, size, batch_size, topology, world_options, params, events='none', max_cpu_seconds=None,
+                 max_peak_surge=None, interrupt=None):
+    world, (asg_connection, elb_connection, elb2_connection, ec2_connection) = asg_sim.simulate(ec2_asg,
+                                                                                              **world_options)
+    load_balancers, target_groups = TOPOLOGIES[topology]
+    module_params = {
+        'name': 'bench',
+        'launch_config_name': 'lc-new',
+        'min_size': size,
+        'max_size': size,
+        'desired_capacity': size,
+        'availability_zones': list(world.zones),
+        'load_balancers': list(load_balancers),
+        'target_groups': list(target_groups),
+        'health_check_type': 'ELB' if (load_balancers or target_groups) else 'EC2',
+        'replace_batch_size': batch_size,
+        'replace_all_instances': True,
+        'wait_timeout': 3600,
+    }
+    sqs_connection = None
+    if (events != 'none'):
+        world.add_queue(EVENT_QUEUE, [EVENT_TOPIC])
+        sqs_connection = asg_sim.FakeSqs(world)
+        module_params['event_queue_url'] = EVENT_QUEUE
+        module_params['notification_topic'] = EVENT_TOPIC
+    module_params.update(params)
+    terminated = None
+    if (interrupt and scenario == 'replace'):
+        when, count = interrupt
+        terminated = interrupt_terminations(asg_connection, when, count)
+        if (not module_params.get('checkpoint_file')):
+            module_params['checkpoint_file'] = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+    module = asg_sim.SimModule(ec2_asg, module_params, check_mode=(scenario == 'plan'))
+    if (scenario in ('replace', 'plan')):
+        world.add_group('bench', 'lc-old', size, load_balancers, target_groups, module_params['health_check_type'])
+        if (events == 'notifications'):
+            world.groups['bench']['notifications'] = {EVENT_TOPIC: module.params['notification_types']}
+    world.add_launch_config('lc-new')
+    for load_balancer in load_balancers:
+        world.add_load_balancer(load_balancer)
+    for target_group in target_groups:
+        world.add_target_group(target_group)
+    metrics = ec2_asg.RunMetrics()
+    connections = (asg_connection, elb_connection, elb2_connection, ec2_connection, sqs_connection)
+
+    def run(module):
+        asg_connection, elb_connection, elb2_connection, ec2_connection = ec2_asg.wrap_connections(
+            module, metrics, *connections)
+        ec2_asg.manage_group(asg_connection, ec2_connection, elb_connection, elb2_connection, module)
+
+    clock = world.clock
+    started = clock.time()
+    cpu_started = time.time()
+    error = None
+    try:
+        try:
+            run(module)
+        except Interrupted:
+            # a later run picks the replacement up from its checkpoint
+            run(asg_sim.SimModule(ec2_asg, module_params))
+            error = resume_error(world, size, terminated)
+        else:
+            if (terminated is not None):
+                error = 'made only {0} terminations, never interrupted'.format(len(terminated))
+    except asg_sim.ModuleFailed as e:
+        error = e.args[0].get('msg')
+    except botocore.exceptions.ClientError as e:
+        error = str(e)
+    cpu_seconds = time.time() - cpu_started
+    if (error is None and max_cpu_seconds is not None and cpu_seconds > max_cpu_seconds):
+        error = 'took {0:.2f}s of CPU, more than {1}s'.format(cpu_seconds, max_cpu_seconds)
+    peak_capacity = world.groups['bench'].get('peak_capacity') if 'bench' in world.groups else None
+    if (error is None and max_peak_surge is not None and peak_capacity is not None and
+            peak_capacity > size + max_peak_surge):
+        error = 'peaked at {0} instances, more than {1} above {2}'.format(peak_capacity, max_peak_surge, size)
+    return {
+        'scenario': scenario,
+        'size': size,
+        'batch_size': batch_size,
+        'topology': topology,
+        'events': events,
+        'seconds': round(clock.time() - started, 1),
+        'sleep_seconds': round(clock.slept, 1),
+        'api_calls': world.api_calls(),
+        'throttled': world.throttled,
+        'retries': metrics.retries,
+        'calls': dict(world.calls),
+        'phases': metrics.as_dict()['phases'],
+        'peak_capacity': peak_capacity,
+        'cpu_seconds': round(cpu_seconds, 3),
+        'error': error,
+    }
+
+
+def csv_list(convert):
+    return lambda value: [convert(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scenarios', type=csv_list(str), default=['create', 'replace'])
+    parser.add_argument('--sizes', type=csv_list(int), default=[10, 50, 200])
+    parser.add_argument('--batches', type=csv_list(int), default=[1, 5])
+    parser.add_argument('--topologies', type=csv_list(str), default=sorted(TOPOLOGIES))
+    parser.add_argument('--events', choices=['none', 'notifications'], default='none',
+                        help='wait on simulated autoscaling events instead of polling')
+    parser.add_argument('--boot-seconds', type=float, default=60)
+    parser.add_argument('--healthy-seconds', type=float, default=30)
+    parser.add_argument('--drain-seconds', type=float, default=20)
+    parser.add_argument('--calls-per-second', type=float, default=None,
+                        help='throttle each simulated service beyond this rate')
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=JSON',
+                        help='extra module parameter, e.g. --param replace_pipeline=true')
+    parser.add_argument('--max-cpu-seconds', type=float, default=None,
+                        help='fail any run that takes longer than this in CPU time')
+    parser.add_argument('--max-peak-surge', type=int, default=None,
+                        help='fail any run whose group ever had more than this many instances above its size')
+    parser.add_argument('--interrupt', metavar='before:N|after:N', default=None,
+                        help='stop each replace run at its Nth termination and resume it from its checkpoint')
+    parser.add_argument('--json', metavar='PATH', help='also write every result as JSON lines to PATH')
+    args = parser.parse_args()
+
+    world_options = {
+        'boot_seconds': args.boot_seconds,
+        'healthy_seconds': args.healthy_seconds,
+        'drain_seconds': args.drain_seconds,
+        'calls_per_second': args.calls_per_second,
+    }
+    interrupt = None
+    if (args.interrupt):
+        when, count = args.interrupt.split(':')
+        if (when not in ('before', 'after')):
+            parser.error('--interrupt takes before:N or after:N')
+        interrupt = (when, int(count))
+    params = {}
+    for param in args.param:
+        name, value = param.split('=', 1)
+        params[name] = json.loads(value)
+
+    results = []
+    print('{0:<8} {1:>5} {2:>5} {3:<8} {4:>9} {5:>9} {6:>7} {7:>6}  {8}'.format(
+        'scenario', 'size', 'batch', 'lbs', 'seconds', 'slept', 'calls', 'thrott', 'error'))
+    for scenario in args.scenarios:
+        for size in args.sizes:
+            for batch_size in (args.batches if scenario in ('replace', 'plan') else args.batches[:1]):
+                for topology in args.topologies:
+                    result = run_scenario(scenario, size, batch_size, topology, world_options, params,
+                                          args.events, args.max_cpu_seconds, args.max_peak_surge, interrupt)
+                    results.append(result)
+                    print('{scenario:<8} {size:>5} {batch_size:>5} {topology:<8} {seconds:>9} {sleep_seconds:>9} '
+                          '{api_calls:>7} {throttled:>6}  {0}'.format(result['error'] or '', **result))
+    if (args.json):
+        with open(args.json, 'w') as f:
+            for result in results:
+                f.write(json.dumps(result, sort_keys=True) + '\n')
+    return 1 if any(result['error'] for result in results) else 0
+
+
+if (__name__ == '__main__'):
+    sys.exit(main())
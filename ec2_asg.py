@@ -32,8 +32,28 @@ options:
     default: present
   name:
     description:
-      - Unique name for group to be created or deleted
-    required: true
+      - Unique name for group to be created or deleted. Either this or I(groups) is required.
+    required: false
+  groups:
+    description:
+      - List of groups to manage in one run instead of the single group given by I(name). Each entry is a dict with at least a C(name) and any other option of this module except I(state), I(groups) and I(group_concurrency); options an entry leaves out are taken from the task. Groups are managed concurrently over the same AWS connections and each one's result or failure is reported separately under C(groups).
+      - An entry may also be just the name of a group, which is handy to tear several groups down with I(state=absent). Each deleted group then reports its C(drain_seconds) and C(delete_seconds).
+    required: false
+    default: None
+    version_added: "2.4"
+  group_concurrency:
+    description:
+      - Maximum number of entries of I(groups) managed at the same time.
+    required: false
+    default: 4
+    version_added: "2.4"
+  health_check_concurrency:
+    description:
+      - Maximum number of load balancers and target groups whose instance health is queried at the same time while
+        waiting for instances to be healthy.
+    required: false
+    default: 8
+    version_added: "2.4"
   load_balancers:
     description:
       - List of ELB names to use for the auto scaling group
@@ -49,7 +69,36 @@ options:
   launch_config_name:
     description:
       - Name of the Launch configuration to use for the group. See the ec2_lc module for managing these.
-    required: true
+      - Required to create a group unless I(launch_template) is given.
+    required: false
+  launch_template:
+    description:
+      - The launch template to use for the group instead of a launch configuration, a dict of
+        C(launch_template_id) or C(launch_template_name) and optionally C(version).
+      - Without C(version) the group uses the template's default version. I(lc_check) compares instances by template
+        and version as AWS reports them, so give a version number for a rollout to tell new instances from old.
+    required: false
+    version_added: "2.4"
+  mixed_instances_policy:
+    description:
+      - Launch instances of several types from I(launch_template). C(instance_types) lists the types, each a name or a
+        dict of C(instance_type) and C(weighted_capacity). C(instances_distribution) takes the
+        InstancesDistribution of the API with keys in snake case, e.g. C(on_demand_percentage_above_base_capacity).
+      - With weights, the sizes of the group and I(replace_batch_size) are in units of capacity rather than
+        instances, and replacement waits for capacity, so a rollout to bigger instances launches fewer of them.
+    required: false
+    version_added: "2.4"
+  warm_pool:
+    description:
+      - Keep a warm pool of pre-initialized instances for the group, a dict of C(min_size), C(max_group_prepared_capacity),
+        C(pool_state) (C(Stopped), C(Running) or C(Hibernated), default C(Stopped)) and C(reuse_on_scale_in).
+        C(state=absent) deletes the pool.
+      - A group with a pool takes new instances from it. Before a rolling replacement terminates the first batch, it
+        terminates pool instances of another launch config or template and raises the pool's minimum size to the
+        batch size. The group refills the pool in the background, so replacements start warm instead of booting. The
+        pool's configuration is put back afterwards.
+    required: false
+    version_added: "2.4"
   min_size:
     description:
       - Minimum number of instances in group, if unspecified then the current group value will be used.
@@ -74,6 +123,84 @@ options:
     required: false
     version_added: "1.8"
     default: 1
+  replace_mode:
+    description:
+      - How instances are replaced. C(rolling) cycles them in batches of I(replace_batch_size) within the group.
+        C(blue_green) launches a whole replacement fleet at once in a temporary group named after the group with a
+        C(-green) suffix. That group is a clone of the group on the new launch config, but with EC2 health checks and
+        without load balancers or target groups, so its instances take no traffic while in it. Once they are
+        running and healthy they are moved into the group, which registers them with its load balancers and target
+        groups. When they are healthy there, the old instances are drained and terminated, and the temporary group
+        is deleted. The replacement then takes about
+        one boot cycle whatever the size of the group, at the cost of running twice the instances for a while.
+      - The batch and checkpoint options only apply to C(rolling).
+    required: false
+    default: rolling
+    choices: ['rolling', 'blue_green']
+    version_added: "2.4"
+  replace_batch_mode:
+    description:
+      - With C(fixed) every batch has I(replace_batch_size) instances. With C(adaptive) I(replace_batch_size) is the size of the first batch only; the size doubles after every batch that passes its health gates and halves after one that fails its ELB health gate or takes more than half of I(wait_timeout). A failed health gate is waited on once more before the module fails. The sizes used are returned as C(batch_size_history).
+    required: false
+    default: fixed
+    choices: ['fixed', 'adaptive']
+    version_added: "2.4"
+  replace_batch_max_size:
+    description:
+      - Largest batch an C(adaptive) I(replace_batch_mode) may grow to. Defaults to the desired capacity.
+    required: false
+    default: None
+    version_added: "2.4"
+  replace_batch_max_percent:
+    description:
+      - Largest batch an C(adaptive) I(replace_batch_mode) may grow to, as a percentage of the desired capacity.
+    required: false
+    default: None
+    version_added: "2.4"
+  replace_pipeline:
+    description:
+      - Overlap the batches of a rolling replacement. While one batch is drained from its load balancers and terminated, the desired capacity is already raised for the next batch so its replacements boot in the meantime. The extra capacity never exceeds I(replace_max_surge).
+    required: false
+    default: False
+    version_added: "2.4"
+  replace_max_surge:
+    description:
+      - Number of instances above the original max size the group may reach during a pipelined or C(adaptive)
+        replacement. Defaults to twice I(replace_batch_size), or to I(replace_batch_max_size) for an C(adaptive)
+        I(replace_batch_mode) if that is larger.
+    required: false
+    default: None
+    version_added: "2.4"
+  plan_batch_seconds:
+    description:
+      - Time in seconds one batch of a rolling replacement is expected to take. In check mode the module plans the
+        replacement without changing anything and returns it as C(plan), and this is used for its estimated
+        duration. Defaults to the group's health check grace period.
+    required: false
+    default: None
+    version_added: "2.4"
+  checkpoint_file:
+    description:
+      - Path of a file where the progress of a rolling replacement is recorded after every step. If a run fails or
+        is interrupted, the next run for the same group and launch config resumes from it. It restores the sizes the
+        replacement had reached, finishes the terminations of a batch it stopped in and skips the batches that
+        already finished. The file is removed once the replacement completes.
+      - When managing I(groups), give each entry its own checkpoint_file.
+    required: false
+    default: None
+    version_added: "2.4"
+  progress_file:
+    description:
+      - Path of a file or FIFO the module appends its progress to while it runs, as one JSON object per line
+        written as it happens. There are events for the start and end of a rolling replacement and of each of its
+        batches, for instances terminated, and for every check of a wait with the viable, healthy or terminating
+        instances counted and the seconds left until I(wait_timeout). Every event has C(event), C(group) and
+        C(time) keys.
+      - Opening a FIFO blocks until something reads from it. If the stream cannot be written, the run carries on
+        without it.
+    required: false
+    default: None
+    version_added: "2.4"
   replace_instances:
     description:
       - List of instance_ids belonging to the named ASG that you would like to terminate and be replaced with instances matching the current launch configuration.
@@ -119,8 +246,124 @@ options:
   wait_timeout:
     description:
       - how long before wait instances to become viable when replaced.  Used in conjunction with instance_ids option.
+      - With I(state=absent) it bounds the whole teardown of a group, draining and deletion together.
     default: 300
     version_added: "1.8"
+  force_delete:
+    description:
+      - With I(state=absent), delete the group with ForceDelete straight away, terminating its instances and any
+        outstanding lifecycle actions along with it, instead of scaling it to zero and waiting for it to drain
+        first.
+    required: false
+    default: no
+    version_added: "2.4"
+  update_timeout:
+    description:
+      - Overall deadline in seconds shared by every wait of the run, in addition to the per-wait I(wait_timeout). Unset means no overall deadline.
+    required: false
+    default: None
+    version_added: "2.4"
+  wait_interval:
+    description:
+      - Seconds to sleep after the first unsuccessful check of a wait. A condition that already holds is never slept on.
+    required: false
+    default: 5
+    version_added: "2.4"
+  wait_max_interval:
+    description:
+      - Upper bound in seconds for the interval between two checks of a wait.
+    required: false
+    default: 20
+    version_added: "2.4"
+  wait_backoff:
+    description:
+      - Factor the interval between two checks grows by after every unsuccessful check.
+    required: false
+    default: 1.5
+    version_added: "2.4"
+  wait_jitter:
+    description:
+      - Fraction by which each interval is randomly shortened or lengthened, so concurrent runs do not poll in lockstep.
+    required: false
+    default: 0.1
+    version_added: "2.4"
+  api_rate_limit:
+    description:
+      - Most calls per second made to each AWS service, shared by every group of the run. C(0) disables the client-side limit.
+    required: false
+    default: 10
+    version_added: "2.4"
+  api_burst:
+    description:
+      - Number of calls to a service that may go out at once before I(api_rate_limit) applies. Defaults to I(api_rate_limit).
+    required: false
+    default: None
+    version_added: "2.4"
+  api_max_retries:
+    description:
+      - Most times a single throttled, server side failed or timed out call, or one whose connection failed, is
+        retried.
+    required: false
+    default: 8
+    version_added: "2.4"
+  api_retry_budget:
+    description:
+      - Total number of retries all calls of the run may use together. Once spent, errors are no longer retried.
+    required: false
+    default: 200
+    version_added: "2.4"
+  api_retry_base_delay:
+    description:
+      - Smallest delay in seconds before a retry. Delays grow with decorrelated jitter from there.
+    required: false
+    default: 0.5
+    version_added: "2.4"
+  api_retry_max_delay:
+    description:
+      - Largest delay in seconds before a retry.
+    required: false
+    default: 20
+    version_added: "2.4"
+  event_queue_url:
+    description:
+      - URL of an SQS queue subscribed to I(notification_topic), which receives the group's autoscaling
+        notifications. Requires I(notification_topic), whose I(notification_types) have to include
+        C(autoscaling:EC2_INSTANCE_LAUNCH) and C(autoscaling:EC2_INSTANCE_TERMINATE).
+      - Waits for instances to launch or terminate then block on the queue and only describe the group again once
+        the launches or terminations they wait for have been notified. They fall back to polling after
+        I(event_fallback_interval) seconds without such an event.
+      - The queue should be dedicated to this module. Messages read from it are deleted.
+    required: false
+    default: None
+    version_added: "2.4"
+  event_fallback_interval:
+    description:
+      - Longest time in seconds a wait blocks on I(event_queue_url) before describing the group anyway, in case a
+        notification was lost.
+    required: false
+    default: 300
+    version_added: "2.4"
+  metadata_cache_dir:
+    description:
+      - Directory on the host running the module where the availability zones of the region and the launch
+        configurations looked up are kept for I(metadata_cache_ttl) seconds. Every run that uses the directory
+        shares them, per account and region, so a play creating many groups looks them up only once. Unset means
+        they are looked up once per run.
+    required: false
+    default: None
+    version_added: "2.4"
+  metadata_cache_ttl:
+    description:
+      - Seconds that entries of I(metadata_cache_dir) stay valid.
+    required: false
+    default: 900
+    version_added: "2.4"
+  metrics_file:
+    description:
+      - Path to also write the run's C(metrics) to as JSON.
+    required: false
+    default: None
+    version_added: "2.4"
   wait_for_instances:
     description:
       - Wait for the ASG instances to be in a ready state before exiting.  If instances are behind an ELB, it will wait until the ELB determines all instances have a lifecycle_state of  "InService" and  a health_status of "Healthy".
@@ -216,10 +459,129 @@ to "replace_instances":
     max_size: 5
     desired_capacity: 5
     region: us-east-1
+
+To roll several groups of a tier in one task, list them in "groups". Options
+given on the task apply to every group unless the entry overrides them:
+
+- ec2_asg:
+    launch_config_name: my_new_lc
+    health_check_type: ELB
+    replace_all_instances: yes
+    group_concurrency: 8
+    metrics_file: /tmp/rollout-metrics.json
+    region: us-east-1
+    groups:
+    - name: web
+      min_size: 5
+      max_size: 5
+    - name: api
+      min_size: 10
+      max_size: 10
+      replace_batch_size: 2
+
+In check mode nothing is changed and a rolling replacement is planned instead:
+the result's "plan" holds the changes to the group, the batches, peak capacity,
+the instances it would terminate, the API calls it would at least make and an
+estimated duration. Outside check mode the changes made to an existing group
+are returned as "changes".
+
+- ec2_asg:
+    name: myasg
+    launch_config_name: my_new_lc
+    replace_all_instances: yes
+    replace_batch_size: 10
+    plan_batch_seconds: 240
+    min_size: 100
+    max_size: 100
+    desired_capacity: 100
+    region: us-east-1
+  check_mode: yes
+  register: rollout_plan
+
+To learn about launches and terminations from the group's notifications
+instead of polling for them, subscribe an SQS queue to the notification topic:
+
+- ec2_asg:
+    name: myasg
+    launch_config_name: my_new_lc
+    replace_all_instances: yes
+    notification_topic: arn:aws:sns:us-east-1:123456789012:asg-events
+    event_queue_url: https://sqs.us-east-1.amazonaws.com/123456789012/asg-events
+    min_size: 5
+    max_size: 5
+    desired_capacity: 5
+    region: us-east-1
+
+To follow a long rolling replacement from another process, have the module
+write its progress as JSON lines, e.g. to a FIFO read by the orchestrator:
+
+- ec2_asg:
+    name: myasg
+    launch_config_name: my_new_lc
+    replace_all_instances: yes
+    replace_batch_size: 5
+    progress_file: /var/run/deploy/myasg.progress
+    min_size: 50
+    max_size: 50
+    desired_capacity: 50
+    region: us-east-1
+
+To roll a group onto a launch template and bigger instances, weight the
+instance types: with sizes counted in vCPUs of m5.xlarge, 16 m5.xlarge are
+replaced by 4 m5.4xlarge:
+
+- ec2_asg:
+    name: myasg
+    launch_template:
+      launch_template_name: web
+      version: 7
+    mixed_instances_policy:
+      instance_types:
+      - instance_type: m5.4xlarge
+        weighted_capacity: 4
+      - instance_type: m5.xlarge
+        weighted_capacity: 1
+      instances_distribution:
+        on_demand_percentage_above_base_capacity: 100
+    replace_all_instances: yes
+    replace_batch_size: 4
+    min_size: 16
+    max_size: 16
+    desired_capacity: 16
+    region: us-east-1
+
+To have replacements start from stopped, already initialized instances rather
+than boot, keep a warm pool:
+
+- ec2_asg:
+    name: myasg
+    launch_config_name: my_new_lc
+    warm_pool:
+      min_size: 5
+      pool_state: Stopped
+    replace_all_instances: yes
+    replace_batch_size: 5
+    min_size: 50
+    max_size: 50
+    desired_capacity: 50
+    region: us-east-1
 '''
+import copy
+import hashlib
+import json
+import os
 import time
+import random
+import threading
 import logging as log
 import traceback
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 from ansible.module_utils.basic import *
 from ansible.module_utils.ec2 import *
@@ -263,10 +625,12 @@ ANSIBLE_ASG_UPDATABLE_ATTRIBUTES = [
     'health_check_type',
     'health_check_period',
     'placement_group',
-    'vpc_zone_identifier'
+    'vpc_zone_identifier',
     'termination_policies',
 ]
 
+LAUNCH_SPEC_ATTRIBUTES = ('LaunchConfigurationName', 'LaunchTemplate', 'MixedInstancesPolicy')
+
 ASG_UPDATABLE_ATTRIBUTES = [
     'AutoScalingGroupName',
     'LaunchConfigurationName',
@@ -283,7 +647,753 @@ ASG_UPDATABLE_ATTRIBUTES = [
     'NewInstancesProtectedFromScaleIn'
 ]
 
-INSTANCE_ATTRIBUTES = ('instance_id', 'health_status', 'lifecycle_state', 'launch_config_name')
+INSTANCE_ATTRIBUTES = ('instance_id', 'health_status', 'lifecycle_state', 'launch_key', 'availability_zone', 'weight')
+
+InstanceRecord = namedtuple('InstanceRecord', INSTANCE_ATTRIBUTES)
+
+# most entries a single tag, load balancer, target group or instance call accepts
+API_BATCH_LIMITS = {
+    'tags': 50,
+    'load_balancers': 10,
+    'target_groups': 10,
+    'instances': 20,
+}
+
+# autoscaling calls that change a group and so make any cached describe result stale
+ASG_WRITE_OPERATIONS = (
+    'attach_instances',
+    'attach_load_balancer_target_groups',
+    'attach_load_balancers',
+    'create_auto_scaling_group',
+    'create_or_update_tags',
+    'delete_auto_scaling_group',
+    'delete_notification_configuration',
+    'delete_tags',
+    'delete_warm_pool',
+    'detach_instances',
+    'detach_load_balancer_target_groups',
+    'detach_load_balancers',
+    'put_notification_configuration',
+    'put_warm_pool',
+    'set_desired_capacity',
+    'terminate_instance_in_auto_scaling_group',
+    'update_auto_scaling_group',
+)
+
+
+# client methods that do not make a request to AWS
+NON_API_METHODS = ('can_paginate', 'generate_presigned_url', 'get_paginator', 'get_waiter')
+
+# error codes AWS answers with when a client calls faster than it is allowed to
+THROTTLING_ERROR_CODES = (
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'RequestLimitExceeded',
+    'TooManyRequestsException',
+    'SlowDown',
+    'PriorRequestNotComplete',
+)
+
+
+class RunMetrics(object):
+    ''' Call counts, errors and a latency histogram for every operation of
+        every wrapped client, and the time spent in each phase of the run.
+        One instance is shared by all clients of a run, from any thread. '''
+
+    # upper bounds in seconds of the latency histogram buckets
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.phases = {}
+        self.throttled = 0
+        self.retries = 0
+        self.rate_limited_seconds = 0.0
+
+    def record_retry(self, throttled):
+        with self.lock:
+            self.retries += 1
+            if (throttled):
+                self.throttled += 1
+
+    def record_rate_limit(self, seconds):
+        with self.lock:
+            self.rate_limited_seconds += seconds
+
+    def record_call(self, service, operation, seconds, error_code=None):
+        with self.lock:
+            operations = self.calls.setdefault(service, {})
+            stats = operations.get(operation)
+            if (stats is None):
+                stats = operations[operation] = {
+                    'count': 0,
+                    'errors': {},
+                    'seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'histogram': [0] * (len(self.LATENCY_BUCKETS) + 1)
+                }
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            if (error_code):
+                stats['errors'][error_code] = stats['errors'].get(error_code, 0) + 1
+            bucket = 0
+            while (bucket < len(self.LATENCY_BUCKETS) and seconds > self.LATENCY_BUCKETS[bucket]):
+                bucket += 1
+            stats['histogram'][bucket] += 1
+
+    @contextmanager
+    def phase(self, name):
+        started = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - started
+            with self.lock:
+                stats = self.phases.setdefault(name, {'count': 0, 'seconds': 0.0})
+                stats['count'] += 1
+                stats['seconds'] += seconds
+
+    def as_dict(self):
+        with self.lock:
+            api_calls = {}
+            total = 0
+            for service, operations in self.calls.items():
+                api_calls[service] = {}
+                for operation, stats in operations.items():
+                    histogram = {}
+                    for bucket, count in enumerate(stats['histogram']):
+                        if (bucket < len(self.LATENCY_BUCKETS)):
+                            histogram['le_%s' % self.LATENCY_BUCKETS[bucket]] = count
+                        else:
+                            histogram['le_inf'] = count
+                    api_calls[service][operation] = {
+                        'count': stats['count'],
+                        'errors': dict(stats['errors']),
+                        'seconds': round(stats['seconds'], 3),
+                        'max_seconds': round(stats['max_seconds'], 3),
+                        'histogram': histogram
+                    }
+                    total += stats['count']
+            phases = dict((name, {'count': stats['count'], 'seconds': round(stats['seconds'], 3)})
+                          for name, stats in self.phases.items())
+        return {
+            'api_call_count': total,
+            'api_calls': api_calls,
+            'phases': phases,
+            'throttled_calls': self.throttled,
+            'retries': self.retries,
+            'rate_limited_seconds': round(self.rate_limited_seconds, 3)
+        }
+
+
+class TokenBucket(object):
+    ''' Client-side rate limiter shared by every thread using a client: up to
+        burst calls go through at once, after that calls are spaced out to
+        rate per second. '''
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        ''' Takes a token, sleeping until it is due, and returns the seconds slept. '''
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # the token is reserved even when it is not there yet, so
+            # concurrent callers queue up behind each other
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if (delay > 0):
+            time.sleep(delay)
+        return delay
+
+
+class RetryPolicy(object):
+    ''' Retries throttled and 5xx calls, and calls whose connection failed or
+        timed out, with decorrelated jitter backoff. Each
+        call is retried at most max_retries times, and all calls of a run
+        share a budget of retries; once it is spent errors are raised as is. '''
+
+    def __init__(self, max_retries, budget, base_delay, max_delay):
+        self.max_retries = max_retries
+        self.budget = budget
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+
+    def retryable(self, e):
+        if (not isinstance(e, botocore.exceptions.ClientError)):
+            # botocore's own retries are off, so endpoint connection errors,
+            # timeouts and closed connections are retried here
+            return True
+        error = e.response.get('Error', {})
+        status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        if (error.get('Code') in THROTTLING_ERROR_CODES):
+            return True
+        return status >= 500
+
+    def take(self):
+        with self.lock:
+            if (self.budget <= 0):
+                return False
+            self.budget -= 1
+            return True
+
+    def next_delay(self, delay):
+        return min(self.max_delay, random.uniform(self.base_delay, max(delay, self.base_delay) * 3))
+
+
+class ApiClient(object):
+    ''' Wraps a boto3 client so that every API call made through it waits for
+        the client's rate limiter, is retried according to the run's retry
+        policy when throttled or failing server side, and is counted and
+        timed in the run's metrics. '''
+
+    def __init__(self, connection, service, metrics, limiter=None, retry_policy=None):
+        self.connection = connection
+        self.service = service
+        self.metrics = metrics
+        self.limiter = limiter
+        self.retry_policy = retry_policy
+        # descriptions that do not change during a run, looked up once
+        self.lookups = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.connection, name)
+        if (name in NON_API_METHODS or name.startswith('_') or not callable(attr)):
+            return attr
+
+        def call(*args, **kwargs):
+            retries = 0
+            delay = 0
+            while (True):
+                if (self.limiter):
+                    self.metrics.record_rate_limit(self.limiter.acquire())
+                started = time.time()
+                try:
+                    result = attr(*args, **kwargs)
+                except (botocore.exceptions.ClientError, botocore.exceptions.ConnectionError,
+                        botocore.exceptions.HTTPClientError) as e:
+                    if (isinstance(e, botocore.exceptions.ClientError)):
+                        error_code = e.response.get('Error', {}).get('Code', 'Unknown')
+                    else:
+                        error_code = type(e).__name__
+                    self.metrics.record_call(self.service, name, time.time() - started, error_code)
+                    policy = self.retry_policy
+                    if (not policy or not policy.retryable(e) or retries >= policy.max_retries or not policy.take()):
+                        raise
+                    retries += 1
+                    self.metrics.record_retry(error_code in THROTTLING_ERROR_CODES)
+                    delay = policy.next_delay(delay)
+                    log.debug("Retrying {0}.{1} in {2:.1f}s after {3}".format(self.service, name, delay, error_code))
+                    time.sleep(delay)
+                    continue
+                self.metrics.record_call(self.service, name, time.time() - started)
+                return result
+        return call
+
+
+class LazyClient(object):
+    ''' Stands in for a boto3 client that is only created, by factory, when
+        the run first uses it. '''
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.client = None
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        with self.lock:
+            if (self.client is None):
+                self.client = self.factory()
+        return getattr(self.client, name)
+
+
+class MetadataCache(object):
+    ''' Region metadata that seldom changes: the availability zones of the
+        region and launch configurations by name. A lookup is made once per
+        run, and with metadata_cache_dir it is also kept on disk for
+        metadata_cache_ttl seconds, in one JSON file per account and region
+        that every run of the module on the host shares. The account of the
+        credentials in use is itself kept there, so sts is only asked once
+        per TTL. Anything wrong with the files only costs the lookups. '''
+
+    # groups of one run look up concurrently, and lookups of a key should not overlap
+    lock = threading.RLock()
+
+    def __init__(self, module, region=None, identity=None, sts_connection=None):
+        self.directory = module.params.get('metadata_cache_dir')
+        self.ttl = module.params.get('metadata_cache_ttl')
+        self.region = region
+        self.identity = identity
+        self.sts_connection = sts_connection
+        self.entries = {}
+        self.name = None
+        if (not (self.directory and region and identity and sts_connection)):
+            self.directory = None
+
+    def get(self, key, lookup):
+        ''' The value kept for key, or else the result of lookup(), which is
+            kept unless it is None. '''
+        with self.lock:
+            if (key in self.entries):
+                return self.entries[key]
+            value = self.load(self.file_name(), key)
+            if (value is None):
+                value = lookup()
+                if (value is not None):
+                    # the same value whether it came from the API or from disk
+                    value = json.loads(json.dumps(value, default=str))
+                    self.store(self.file_name(), key, value)
+            if (value is not None):
+                self.entries[key] = value
+            return value
+
+    def file_name(self):
+        if (self.directory and self.name is None):
+            digest = hashlib.sha256(self.identity.encode('utf-8')).hexdigest()
+            account = self.load('accounts.json', digest)
+            if (account is None):
+                try:
+                    account = self.sts_connection.get_caller_identity()['Account']
+                except botocore.exceptions.ClientError as e:
+                    log.debug("Not caching region metadata on disk: {0}".format(str(e)))
+                    self.directory = None
+                    return None
+                self.store('accounts.json', digest, account)
+            self.name = '{0}-{1}.json'.format(account, self.region)
+        return self.name
+
+    def read(self, name):
+        try:
+            with open(os.path.join(self.directory, name)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def load(self, name, key):
+        if (not self.directory or not name):
+            return None
+        entry = self.read(name).get(key)
+        if (entry and time.time() - entry['time'] < self.ttl):
+            return entry['value']
+        return None
+
+    def store(self, name, key, value):
+        if (not self.directory or not name):
+            return
+        now = time.time()
+        entries = dict((k, entry) for k, entry in self.read(name).items() if now - entry['time'] < self.ttl)
+        entries[key] = {'time': now, 'value': value}
+        path = os.path.join(self.directory, name)
+        tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        try:
+            if (not os.path.isdir(self.directory)):
+                os.makedirs(self.directory)
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f, sort_keys=True)
+            os.rename(tmp_path, path)
+        except (IOError, OSError) as e:
+            log.debug("Could not write region metadata to {0}: {1}".format(path, str(e)))
+
+
+def get_metadata_cache(module):
+    ''' The MetadataCache of the run, which the entries of groups share. '''
+    owner = module.module if isinstance(module, GroupModule) else module
+    cache = getattr(owner, 'asg_metadata', None)
+    if (cache is None):
+        cache = MetadataCache(owner)
+        owner.asg_metadata = cache
+    return cache
+
+
+def get_availability_zones(ec2_connection, module):
+    return get_metadata_cache(module).get('availability_zones', lambda: [
+        zone['ZoneName'] for zone in ec2_connection.describe_availability_zones()['AvailabilityZones']])
+
+
+def get_launch_config(asg_connection, module, launch_config_name):
+    ''' The launch configuration named launch_config_name, or None if there
+        is none. '''
+    def lookup():
+        launch_configs = asg_connection.describe_launch_configurations(
+            LaunchConfigurationNames=[launch_config_name])['LaunchConfigurations']
+        return launch_configs[0] if launch_configs else None
+    return get_metadata_cache(module).get('launch_configuration:' + launch_config_name, lookup)
+
+
+def get_target_groups(elb2_connection, target_group_arns):
+    ''' Describes target_group_arns, only once per run for a client wrapped
+        by ApiClient. '''
+    lookups = elb2_connection.lookups if isinstance(elb2_connection, ApiClient) else {}
+    missing = [arn for arn in target_group_arns if ('target_group', arn) not in lookups]
+    if (missing):
+        for target_group in elb2_connection.describe_target_groups(TargetGroupArns=missing)['TargetGroups']:
+            lookups[('target_group', target_group['TargetGroupArn'])] = target_group
+    return [lookups[('target_group', arn)] for arn in target_group_arns]
+
+
+def get_metrics(connection):
+    ''' The metrics a client wrapped by ApiClient reports to, or a throwaway
+        collector for an unwrapped one. '''
+    metrics = getattr(connection, 'metrics', None)
+    if (not isinstance(metrics, RunMetrics)):
+        metrics = RunMetrics()
+    return metrics
+
+
+class AsgSnapshotCache(object):
+    ''' Wraps an autoscaling client for the length of one module run so that
+        every consumer polling the same group in the same poll generation
+        shares a single describe_auto_scaling_groups result. Writes made
+        through the wrapper drop the cached snapshots, and wait loops start
+        a new generation for the group they poll after each sleep. Primed
+        snapshots, read ahead of managing a group, are stamped with the
+        generation they were read in and serve the first get_group of their
+        group only while no wait anywhere in the run has slept since. '''
+
+    def __init__(self, connection):
+        self.connection = connection
+        # counts the sleeps of every wait in the run; primed snapshots taken
+        # in an earlier generation are stale
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.snapshots = {}
+        # group name -> (generation, snapshot) handed over by prime()
+        self.primed = {}
+        # the run's EventStream when event_queue_url is set
+        self.events = None
+
+    def __getattr__(self, name):
+        attr = getattr(self.connection, name)
+        if (name in ASG_WRITE_OPERATIONS):
+            def write(*args, **kwargs):
+                try:
+                    return attr(*args, **kwargs)
+                finally:
+                    self.invalidate(kwargs.get('AutoScalingGroupName'))
+            return write
+        return attr
+
+    def invalidate(self, group_name=None):
+        # terminate_instance_in_auto_scaling_group and tag calls do not name
+        # the group directly, so anything without one clears every snapshot
+        if (group_name is None):
+            self.snapshots.clear()
+            self.primed.clear()
+        else:
+            self.snapshots.pop(group_name, None)
+            self.primed.pop(group_name, None)
+
+    def prime(self, groups):
+        for group_name, asg in groups.items():
+            self.primed[group_name] = (self.generation, asg)
+
+    def next_generation(self, group_name=None):
+        # groups sleep in different threads
+        with self.lock:
+            self.generation += 1
+        self.invalidate(group_name)
+
+    def get_group(self, group_name):
+        # several groups may be polled from different threads, so the snapshot
+        # is only read once and never looked up again after a concurrent clear
+        asg = self.snapshots.get(group_name, self)
+        if (asg is self):
+            # a primed snapshot is used once, and only before anything slept
+            generation, asg = self.primed.pop(group_name, (None, self))
+            if (generation == self.generation):
+                self.snapshots[group_name] = asg
+            else:
+                asg = self
+        if (asg is self):
+            asg_list = self.connection.describe_auto_scaling_groups(AutoScalingGroupNames=[group_name], MaxRecords=1)[
+                'AutoScalingGroups']
+            asg = asg_list[0] if asg_list else None
+            self.snapshots[group_name] = asg
+        if (asg is None):
+            return None
+        if (not isinstance(asg['Instances'], SnapshotInstances)):
+            asg['Instances'] = SnapshotInstances(asg['Instances'])
+        # callers modify the sizes and sort attribute lists in place, so hand
+        # out a copy and keep the snapshot itself untouched; only Instances,
+        # which nothing modifies, is shared so that its index is built once
+        return dict((k, list(v) if isinstance(v, list) and k != 'Instances' else v) for k, v in asg.items())
+
+
+def get_event_stream(asg_connection):
+    if (isinstance(asg_connection, AsgSnapshotCache)):
+        return asg_connection.events
+    return None
+
+
+def poll_sleep(asg_connection, group_name, seconds, events=None):
+    ''' Sleep between two polls of a group and start a new poll generation
+        so the next get_asg_by_name sees fresh data. With an EventStream the
+        sleep ends early when events for the group arrive, and those events
+        are returned. '''
+    woken = []
+    if (events is not None):
+        woken = events.wait(group_name, seconds)
+    else:
+        time.sleep(seconds)
+    if (isinstance(asg_connection, AsgSnapshotCache)):
+        asg_connection.next_generation(group_name)
+    return woken
+
+
+def parse_event(body):
+    ''' Returns the autoscaling notification carried by an SQS message body,
+        as delivered by an SNS subscription, or None for anything else. '''
+    try:
+        event = json.loads(body)
+        if (isinstance(event, dict) and 'TopicArn' in event and 'Message' in event):
+            event = json.loads(event['Message'])
+    except (TypeError, ValueError):
+        return None
+    if (not isinstance(event, dict) or 'AutoScalingGroupName' not in event or 'Event' not in event):
+        return None
+    if (event.get('Event') == 'autoscaling:TEST_NOTIFICATION'):
+        return None
+    return event
+
+
+class EventStream(object):
+    ''' Autoscaling events of the run's groups read from event_queue_url.
+        Events are kept per group until a wait on that group picks them up,
+        so groups polled from different threads can share the queue. '''
+
+    def __init__(self, module, sqs_connection):
+        self.queue_url = module.params.get('event_queue_url')
+        self.fallback_interval = module.params.get('event_fallback_interval')
+        self.sqs_connection = sqs_connection
+        self.lock = threading.Lock()
+        self.events = {}
+
+    def receive(self, seconds):
+        response = self.sqs_connection.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=10,
+                                                       WaitTimeSeconds=int(min(seconds, 20)))
+        messages = response.get('Messages', [])
+        if (not messages):
+            return
+        for message in messages:
+            event = parse_event(message['Body'])
+            if (event is None):
+                continue
+            log.debug("Received event: {0}".format(event))
+            with self.lock:
+                self.events.setdefault(event['AutoScalingGroupName'], []).append(event)
+        self.sqs_connection.delete_message_batch(QueueUrl=self.queue_url, Entries=[
+            {'Id': str(n), 'ReceiptHandle': message['ReceiptHandle']} for n, message in enumerate(messages)])
+
+    def take(self, group_name):
+        with self.lock:
+            return self.events.pop(group_name, [])
+
+    def wait(self, group_name, seconds):
+        ''' Blocks for up to seconds and returns the events for group_name as
+            soon as there are any, or an empty list. '''
+        deadline = time.time() + seconds
+        events = self.take(group_name)
+        while (not events):
+            remaining = deadline - time.time()
+            if (remaining < 1):
+                # long polls only come in whole seconds
+                time.sleep(max(remaining, 0))
+                return self.take(group_name)
+            self.receive(remaining)
+            events = self.take(group_name)
+        return events
+
+
+class Waiter(object):
+    ''' Polls a condition until it holds. The condition is checked straight
+        away, so nothing sleeps when it already holds, and the interval
+        between checks then grows by wait_backoff up to wait_max_interval
+        with wait_jitter applied. Every wait in a run is also bounded by the
+        shared update_timeout deadline when one is set. '''
+
+    def __init__(self, module):
+        self.interval = module.params.get('wait_interval')
+        self.max_interval = module.params.get('wait_max_interval')
+        self.backoff = module.params.get('wait_backoff')
+        self.jitter = module.params.get('wait_jitter')
+        update_timeout = module.params.get('update_timeout')
+        self.deadline = None
+        if (update_timeout):
+            self.deadline = time.time() + update_timeout
+
+    def remaining(self, timeout=None):
+        deadlines = []
+        if (timeout is not None):
+            deadlines.append(time.time() + timeout)
+        if (self.deadline is not None):
+            deadlines.append(self.deadline)
+        if (not deadlines):
+            return None
+        return max(min(deadlines) - time.time(), 0)
+
+    def wait(self, condition, asg_connection=None, group_name=None, timeout=None, events=None):
+        ''' Returns the first truthy result of condition, or None if timeout
+            seconds (or the shared deadline) pass first. A timeout of None
+            only honours the shared deadline. events is a function of the
+            group's notifications received since condition was last checked,
+            telling whether they could let it hold. With the run's
+            EventStream the wait then blocks on the queue and only checks
+            condition again once they do, or after event_fallback_interval. '''
+        deadline = self.remaining(timeout)
+        if (deadline is not None):
+            deadline = time.time() + deadline
+        stream = get_event_stream(asg_connection) if events else None
+        interval = self.interval
+        while (True):
+            result = condition()
+            if (result):
+                return result
+            checked = time.time()
+            received = []
+            while (True):
+                now = time.time()
+                if (deadline is not None and now >= deadline):
+                    return None
+                if (stream is not None):
+                    # nothing can have changed until the notifications say so
+                    delay = checked + stream.fallback_interval - now
+                else:
+                    delay = interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+                    interval = min(interval * self.backoff, self.max_interval)
+                if (deadline is not None):
+                    delay = min(delay, deadline - now)
+                received.extend(poll_sleep(asg_connection, group_name, max(delay, 0), stream))
+                if (stream is None or time.time() >= checked + stream.fallback_interval or events(received)):
+                    break
+
+
+def notified_terminations(pending):
+    ''' An events function for Waiter.wait that holds once the termination
+        of every instance in pending, a set the condition keeps up to date,
+        has been notified. '''
+    seen = set()
+
+    def notified(received):
+        seen.update(event.get('EC2InstanceId') for event in received
+                    if event['Event'] == 'autoscaling:EC2_INSTANCE_TERMINATE')
+        return pending <= seen
+    return notified
+
+
+def run_concurrently(func, items, concurrency):
+    ''' Calls func on each item from at most concurrency worker threads and
+        yields (item, result) pairs in the order they complete. An exception
+        raised by func is re-raised when its item comes up. Items not yet
+        started when the caller stops iterating are dropped. '''
+    items = list(items)
+    if (len(items) <= 1 or concurrency <= 1):
+        for item in items:
+            yield item, func(item)
+        return
+    pending = queue.Queue()
+    done = queue.Queue()
+    for item in items:
+        pending.put(item)
+
+    def worker():
+        while (True):
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                done.put((item, func(item), None))
+            except Exception as e:
+                done.put((item, None, e))
+
+    for i in range(max(min(concurrency, len(items)), 1)):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+    try:
+        for i in range(len(items)):
+            item, result, error = done.get()
+            if (error is not None):
+                raise error
+            yield item, result
+    finally:
+        while (True):
+            try:
+                pending.get_nowait()
+            except queue.Empty:
+                break
+
+
+def get_waiter(module):
+    ''' The waiter, and with it the shared deadline, is created on first use
+        and lives as long as the module run. '''
+    waiter = getattr(module, 'asg_waiter', None)
+    if (waiter is None):
+        waiter = Waiter(module)
+        module.asg_waiter = waiter
+    return waiter
+
+
+class ProgressStream(object):
+    ''' Writes the progress of a run to progress_file as JSON lines, one
+        event per line, each flushed as soon as it is written so that a
+        process tailing the file or reading the other end of a FIFO sees it
+        straight away. Every event carries its name, the group and the time,
+        and events of a wait carry the seconds left until it times out. A
+        stream that cannot be written is given up instead of failing the
+        run. '''
+
+    # the groups of one run may share progress_file
+    lock = threading.Lock()
+
+    def __init__(self, module):
+        self.module = module
+        self.path = module.params.get('progress_file')
+        self.file = None
+
+    def deadline(self, timeout):
+        remaining = get_waiter(self.module).remaining(timeout)
+        if (remaining is None):
+            return None
+        return time.time() + remaining
+
+    def emit(self, event, deadline=None, **fields):
+        if (not self.path):
+            return
+        fields.update(event=event, group=self.module.params.get('name'), time=round(time.time(), 3))
+        if (deadline is not None):
+            fields['remaining_seconds'] = round(max(deadline - time.time(), 0), 1)
+        line = json.dumps(fields, sort_keys=True) + '\n'
+        with self.lock:
+            try:
+                if (self.file is None):
+                    self.file = open(self.path, 'a')
+                self.file.write(line)
+                self.file.flush()
+            except (IOError, OSError) as e:
+                log.debug("Giving up progress stream {0}: {1}".format(self.path, str(e)))
+                self.path = None
+
+
+def get_progress(module):
+    ''' The ProgressStream of the module run, created on first use. '''
+    progress = getattr(module, 'asg_progress', None)
+    if (progress is None):
+        progress = ProgressStream(module)
+        module.asg_progress = progress
+    return progress
 
 
 def enforce_required_arguments(module):
@@ -291,15 +1401,19 @@ def enforce_required_arguments(module):
         they cannot be mandatory arguments for the module, so we enforce
         them here '''
     missing_args = []
-    for arg in ('min_size', 'max_size', 'launch_config_name'):
+    for arg in ('min_size', 'max_size'):
         if (module.params[arg] is None):
             missing_args.append(arg)
+    if (module.params['launch_config_name'] is None and not module.params.get('launch_template')):
+        missing_args.append('launch_config_name or launch_template')
     if (missing_args):
         module.fail_json(
             msg="Missing required arguments for autoscaling group create/update: %s" % ",".join(missing_args))
 
 
 def get_asg_by_name(asg_connection, group_name):
+    if (isinstance(asg_connection, AsgSnapshotCache)):
+        return asg_connection.get_group(group_name)
     asg_list = asg_connection.describe_auto_scaling_groups(AutoScalingGroupNames=[group_name], MaxRecords=1)[
         'AutoScalingGroups']
     if (len(asg_list) > 0):
@@ -307,157 +1421,212 @@ def get_asg_by_name(asg_connection, group_name):
     return None
 
 
-def elb_dreg(asg_connection, elb_connection, elb2_connection, module, group_name, instance_id):
-    asg = get_asg_by_name(asg_connection, group_name)
-    wait_timeout = module.params.get('wait_timeout')
-    count = 1
+class FleetReader(object):
+    ''' Reads many groups with as few calls as the API allows, in pages of up
+        to MAX_GROUPS_PER_PAGE groups of describe_auto_scaling_groups. The
+        groups can prime an AsgSnapshotCache so that managing them starts
+        without a describe. '''
+
+    MAX_GROUPS_PER_PAGE = 100
+
+    def __init__(self, asg_connection):
+        self.asg_connection = asg_connection
+        # group name -> describe result, or None for a group that does not exist
+        self.groups = {}
+
+    def read(self, group_names):
+        ''' Describes the named groups and returns them by name. '''
+        group_names = list(group_names)
+        for name in group_names:
+            self.groups[name] = None
+        for names in get_chunks(group_names, self.MAX_GROUPS_PER_PAGE):
+            args = {'AutoScalingGroupNames': names, 'MaxRecords': self.MAX_GROUPS_PER_PAGE}
+            while True:
+                response = self.asg_connection.describe_auto_scaling_groups(**args)
+                for asg in response['AutoScalingGroups']:
+                    self.groups[asg['AutoScalingGroupName']] = asg
+                if (not response.get('NextToken')):
+                    break
+                args['NextToken'] = response['NextToken']
+        return self.groups
+
+    def prime(self, asg_connection):
+        ''' Hands the groups read so far to asg_connection's snapshot cache. '''
+        if (isinstance(asg_connection, AsgSnapshotCache)):
+            asg_connection.prime(self.groups)
 
-    if (not ((asg['LoadBalancerNames'] or asg['TargetGroupARNs']) and asg['HealthCheckType'] == 'ELB')):
-        return
 
-    load_balancer_names = asg['LoadBalancerNames']
-    if (load_balancer_names):
-        load_balancer_descriptions = elb_connection.describe_load_balancers(LoadBalancerNames=load_balancer_names)[
-            'LoadBalancerDescriptions']
-        for load_balancer_description in load_balancer_descriptions:
-            load_balancer_name = load_balancer_description['LoadBalancerName']
-            for instance in load_balancer_description['Instances']:
-                if instance['InstanceId'] == instance_id:
+def elb_dreg(asg_connection, elb_connection, elb2_connection, module, group_name, instance_ids):
+    with get_metrics(asg_connection).phase('elb_dreg'):
+        asg = get_asg_by_name(asg_connection, group_name)
+        wait_timeout = module.params.get('wait_timeout')
+
+        if (not instance_ids):
+            return
+
+        if (not ((asg['LoadBalancerNames'] or asg['TargetGroupARNs']) and asg['HealthCheckType'] == 'ELB')):
+            return
+
+        instance_ids = set(instance_ids)
+        # instances still draining, indexed by ('elb', load balancer name) or ('target_group', arn)
+        draining = {}
+        load_balancer_names = asg['LoadBalancerNames']
+        if (load_balancer_names):
+            load_balancer_descriptions = elb_connection.describe_load_balancers(LoadBalancerNames=load_balancer_names)[
+                'LoadBalancerDescriptions']
+            for load_balancer_description in load_balancer_descriptions:
+                load_balancer_name = load_balancer_description['LoadBalancerName']
+                instances = [instance for instance in load_balancer_description['Instances']
+                             if instance['InstanceId'] in instance_ids]
+                if (instances):
                     elb_connection.deregister_instances_from_load_balancer(LoadBalancerName=load_balancer_name,
-                                                                           Instances=[instance])
-                    log.debug("De-registering {0} from ELB {1}".format(instance_id, load_balancer_name))
-                    break
+                                                                           Instances=instances)
+                    log.debug("De-registering {0} from ELB {1}".format([i['InstanceId'] for i in instances],
+                                                                       load_balancer_name))
+                    draining[('elb', load_balancer_name)] = set(i['InstanceId'] for i in instances)
+
+        if (asg['TargetGroupARNs']):
+            for target_group in get_target_groups(elb2_connection, asg['TargetGroupARNs']):
+                elb2_connection.deregister_targets(TargetGroupArn=target_group['TargetGroupArn'],
+                                                   Targets=[{'Id': instance_id} for instance_id in instance_ids])
+                draining[('target_group', target_group['TargetGroupArn'])] = set(instance_ids)
+
+        def in_service(load_balancer):
+            kind, name = load_balancer
+            if (kind == 'elb'):
+                return elb_in_service(elb_connection, name, draining[load_balancer])
+            return target_healthy(elb2_connection, name, draining[load_balancer])
+
+        # the whole batch drains together: every tick asks each load balancer once, concurrently,
+        # about the instances it still has in service, and drops the ones that are gone from its set
+        def drained():
+            load_balancers = [load_balancer for load_balancer in sorted(draining) if draining[load_balancer]]
+            for load_balancer, still_in_service in run_concurrently(in_service, load_balancers,
+                                                                    module.params.get('health_check_concurrency')):
+                draining[load_balancer].intersection_update(still_in_service)
+            return not any(draining.values())
+
+        if (not get_waiter(module).wait(drained, timeout=wait_timeout)):
+            # waiting took too long
+            module.fail_json(msg="Waited too long for instances to deregister. {0}".format(time.asctime()))
+
 
-    target_groups = asg['TargetGroupARNs']
-    if (target_groups):
-        target_groups = elb2_connection.describe_target_groups(TargetGroupArns=asg['TargetGroupARNs'])['TargetGroups']
-        for target_group in target_groups:
-            elb2_connection.deregister_targets(TargetGroupArn=target_group['TargetGroupArn'],
-                                               Targets=[{'Id': instance_id}])
-
-    wait_timeout = time.time() + wait_timeout
-    while (wait_timeout > time.time() and count > 0):
-        count = 0
-        for load_balancer_name in load_balancer_names:
-            lb_instances = elb_connection.describe_instance_health(LoadBalancerName=load_balancer_name)['InstanceStates']
-            for i in lb_instances:
-                if (i['InstanceId'] == instance_id and i['State'] == "InService"):
-                    count += 1
-                    log.debug("{0}: {1}".format(i['InstanceId'], i['State']))
-        for target_group in target_groups:
-            target_health_descriptions = \
-            elb2_connection.describe_target_health(TargetGroupArn=target_group['TargetGroupArn'],
-                                                   Targets=[{'Id': instance_id}])['TargetHealthDescriptions']
-            for target_health_description in target_health_descriptions:
-                if (target_health_description['Target']['Id'] == instance_id and
-                            target_health_description['TargetHealth']['State'] == "healthy"):
-                    count += 1
-                    log.debug("{0}: {1}".format(target_health_description['Target']['Id'],
-                                                target_health_description['TargetHealth']['State']))
-        time.sleep(10)
-
-    if (wait_timeout <= time.time()):
-        # waiting took too long
-        module.fail_json(msg="Waited too long for instance to deregister. {0}".format(time.asctime()))
-
-
-def elb_healthy(asg_connection, elb_connection, elb2_connection, module, group_name, launch_config_name):
-    healthy_instances = None
+def elb_in_service(elb_connection, load_balancer_name, instance_ids):
+    ''' Returns which of instance_ids the classic ELB still has InService. One
+        call covers the whole set; the ELB rejects the call when one of them is
+        no longer registered, and only then is each instance asked about alone. '''
+    try:
+        lb_instances = elb_connection.describe_instance_health(
+            LoadBalancerName=load_balancer_name,
+            Instances=[{'InstanceId': instance_id} for instance_id in instance_ids])['InstanceStates']
+    except botocore.exceptions.ClientError as e:
+        if (e.response['Error']['Code'] != 'InvalidInstance'):
+            raise
+        lb_instances = []
+        for instance_id in instance_ids:
+            try:
+                lb_instances.extend(elb_connection.describe_instance_health(
+                    LoadBalancerName=load_balancer_name, Instances=[{'InstanceId': instance_id}])['InstanceStates'])
+            except botocore.exceptions.ClientError as e:
+                if (e.response['Error']['Code'] != 'InvalidInstance'):
+                    raise
+    in_service = set(i['InstanceId'] for i in lb_instances if i['State'] == "InService")
+    log.debug("{0}: {1} of {2} instances InService".format(load_balancer_name, len(in_service), len(lb_instances)))
+    return in_service
+
+
+def target_healthy(elb2_connection, target_group_arn, instance_ids):
+    ''' Returns which of instance_ids the target group considers healthy. '''
+    target_health_descriptions = elb2_connection.describe_target_health(
+        TargetGroupArn=target_group_arn,
+        Targets=[{'Id': instance_id} for instance_id in instance_ids])['TargetHealthDescriptions']
+    healthy = set(target_health_description['Target']['Id'] for target_health_description in target_health_descriptions
+                  if target_health_description['TargetHealth']['State'] == "healthy")
+    log.debug("{0}: {1} of {2} targets healthy".format(target_group_arn, len(healthy),
+                                                       len(target_health_descriptions)))
+    return healthy
+
+
+def elb_healthy(asg_connection, elb_connection, elb2_connection, module, group_name, launch_key):
+    ''' Counts the capacity of the instances that the ASG and every one of
+        its load balancers and target groups consider healthy. The load
+        balancers are queried concurrently and the answers intersected as
+        they come in, stopping as soon as no instance is left. '''
     asg = get_asg_by_name(asg_connection, group_name)
     # get healthy, inservice instances from ASG
-    instances = []
-    for instance in asg['Instances']:
-        if (instance['LifecycleState'] == 'InService' and instance['HealthStatus'] == 'Healthy'):
-            if (launch_config_name):
-                if (('LaunchConfigurationName' in instance) and (instance['LaunchConfigurationName'] == launch_config_name)):
-                    instances.append({
-                        'InstanceId': instance['InstanceId']
-                    })
-            else:
-                instances.append({
-                    'InstanceId': instance['InstanceId']
-                })
+    index = get_instance_index(asg)
+    instance_ids = index.viable(launch_key)
 
-    log.debug("ASG considers the following instances InService and Healthy: {0}".format(instances))
+    log.debug("ASG considers the following instances InService and Healthy: {0}".format(sorted(instance_ids)))
     log.debug("ELB instance status:")
-    if (instances):
-        for load_balancer_name in asg['LoadBalancerNames']:
+    if (not instance_ids):
+        return 0
+    checks = [('elb', load_balancer_name) for load_balancer_name in asg['LoadBalancerNames']]
+    if (asg['TargetGroupARNs']):
+        checks.extend(('target_group', target_group['TargetGroupArn'])
+                      for target_group in get_target_groups(elb2_connection, asg['TargetGroupARNs']))
+
+    def check(load_balancer):
+        kind, name = load_balancer
+        if (kind == 'elb'):
             # we catch a race condition that sometimes happens if the instance exists in the ASG
             # but has not yet show up in the ELB
             try:
-                lb_instances = \
-                elb_connection.describe_instance_health(LoadBalancerName=load_balancer_name, Instances=instances)[
-                    'InstanceStates']
+                lb_instances = elb_connection.describe_instance_health(
+                    LoadBalancerName=name,
+                    Instances=[{'InstanceId': instance_id} for instance_id in sorted(instance_ids)])['InstanceStates']
             except botocore.exceptions.ClientError as e:
-                if (e['Error']['Code'] == 'InvalidInstance'):
-                    return None
+                if (e.response['Error']['Code'] == 'InvalidInstance'):
+                    return set()
+                raise
+            healthy = set(i['InstanceId'] for i in lb_instances if i['State'] == "InService")
+            log.debug("{0}: {1} of {2} instances InService".format(name, len(healthy), len(lb_instances)))
+            return healthy
+        return target_healthy(elb2_connection, name, sorted(instance_ids))
+
+    healthy_instances = set(instance_ids)
+    try:
+        for load_balancer, healthy in run_concurrently(check, checks, module.params.get('health_check_concurrency')):
+            healthy_instances &= healthy
+            if (not healthy_instances):
+                break
+    except botocore.exceptions.ClientError as e:
+        module.fail_json(msg=str(e))
+    return index.capacity(healthy_instances)
 
-                module.fail_json(msg=str(e))
 
-            new_healthy_instances = set()
-            for i in lb_instances:
-                if (i['State'] == "InService"):
-                    new_healthy_instances.add(i['InstanceId'])
-                log.debug("{0}: {1}".format(i['InstanceId'], i['State']))
-            if (healthy_instances):
-                healthy_instances = healthy_instances.intersection(new_healthy_instances)
-            else:
-                healthy_instances = new_healthy_instances
+def wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name, launch_key = None,
+                 min_size = 0, fail = True):
+    with get_metrics(asg_connection).phase('wait_for_elb'):
+        wait_timeout = module.params.get('wait_timeout')
 
-        if (asg['TargetGroupARNs']):
-            target_groups = elb2_connection.describe_target_groups(TargetGroupArns=asg['TargetGroupARNs'])['TargetGroups']
-            for target_group in target_groups:
-                new_healthy_instances = set()
-                targets = []
-                for instance in instances:
-                    targets.append({
-                        'Id': instance['InstanceId']
-                    })
-                target_health_descriptions = \
-                elb2_connection.describe_target_health(TargetGroupArn=target_group['TargetGroupArn'], Targets=targets)[
-                    'TargetHealthDescriptions']
-                for target_health_description in target_health_descriptions:
-                    if (target_health_description['TargetHealth']['State'] == "healthy"):
-                        new_healthy_instances.add(target_health_description['Target']['Id'])
-                    log.debug("{0}: {1}".format(target_health_description['Target']['Id'],
-                                                target_health_description['TargetHealth']['State']))
-                if (healthy_instances):
-                    healthy_instances = healthy_instances.intersection(new_healthy_instances)
-                else:
-                    healthy_instances = new_healthy_instances
+        # if the health_check_type is ELB, we want to query the ELBs directly for instance
+        # status as to avoid health_check_grace period that is awarded to ASG instances
+        asg = get_asg_by_name(asg_connection, group_name)
 
-    if (healthy_instances):
-        return len(healthy_instances)
-    else:
-        return 0
+        if ((asg['TargetGroupARNs'] or asg['LoadBalancerNames']) and asg['HealthCheckType'] == 'ELB'):
+            log.debug("Waiting for ELB to consider instances healthy.")
 
+            if (launch_key == None):
+                min_size = asg['MinSize']
+            progress = get_progress(module)
+            deadline = progress.deadline(wait_timeout)
 
-def wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name, launch_config_name = None,
-                 min_size = 0):
-    wait_timeout = module.params.get('wait_timeout')
+            def healthy():
+                healthy_instances = elb_healthy(asg_connection, elb_connection, elb2_connection, module, group_name,
+                                                launch_key) or 0
+                log.debug("ELB thinks {0} instances are healthy.".format(healthy_instances))
+                progress.emit('elb_healthy', deadline, healthy=healthy_instances, wanted=min_size)
+                return healthy_instances >= min_size
 
-    # if the health_check_type is ELB, we want to query the ELBs directly for instance
-    # status as to avoid health_check_grace period that is awarded to ASG instances
-    asg = get_asg_by_name(asg_connection, group_name)
-
-    if ((asg['TargetGroupARNs'] or asg['LoadBalancerNames']) and asg['HealthCheckType'] == 'ELB'):
-        log.debug("Waiting for ELB to consider instances healthy.")
-
-        wait_timeout = time.time() + wait_timeout
-        healthy_instances = elb_healthy(asg_connection, elb_connection, elb2_connection, module, group_name,
-                                        launch_config_name)
-
-        if (launch_config_name == None):
-            min_size = asg['MinSize']
-        while (healthy_instances < min_size and wait_timeout > time.time()):
-            healthy_instances = elb_healthy(asg_connection, elb_connection, elb2_connection, module, group_name,
-                                            launch_config_name)
-            log.debug("ELB thinks {0} instances are healthy.".format(healthy_instances))
-            time.sleep(10)
-        if (wait_timeout <= time.time()):
-            # waiting took too long
-            module.fail_json(msg="Waited too long for ELB instances with lc " + launch_config_name + " (" + str(min_size) + ") to be healthy. %s" % time.asctime())
-        log.debug("Waiting complete.  ELB thinks {0} instances are healthy.".format(healthy_instances))
+            if (not get_waiter(module).wait(healthy, asg_connection, group_name, wait_timeout)):
+                # waiting took too long
+                if (not fail):
+                    return False
+                module.fail_json(msg="Waited too long for ELB instances with lc {0} ({1}) to be healthy. {2}".format(
+                    launch_key, min_size, time.asctime()))
+            log.debug("Waiting complete.  ELB thinks at least {0} instances are healthy.".format(min_size))
+        return True
 
 
 def create_autoscaling_group(asg_connection, ec2_connection, elb_connection, elb2_connection, module):
@@ -470,7 +1639,6 @@ def create_autoscaling_group(asg_connection, ec2_connection, elb_connection, elb
     max_size = module.params['max_size']
     desired_capacity = module.params.get('desired_capacity')
     vpc_zone_identifier = module.params.get('vpc_zone_identifier')
-    tags = module.params.get('tags')
     health_check_period = module.params.get('health_check_period')
     health_check_type = module.params.get('health_check_type')
     default_cooldown = module.params.get('default_cooldown')
@@ -482,35 +1650,24 @@ def create_autoscaling_group(asg_connection, ec2_connection, elb_connection, elb
 
     asg = get_asg_by_name(asg_connection, group_name)
 
-    if (not vpc_zone_identifier and not availability_zones):
-        region, ec2_url, aws_connect_params = get_aws_connection_info(module)
-    elif (vpc_zone_identifier):
+    if (vpc_zone_identifier):
         vpc_zone_identifier = ','.join(vpc_zone_identifier)
 
-    asg_tags = []
-    if (tags != None):
-        for tag in tags:
-            for k, v in tag.items():
-                if (k != 'propagate_at_launch'):
-                    asg_tags.append({
-                        'Key': k,
-                        'Value': v,
-                        'ResourceType': 'auto-scaling-group',
-                        'ResourceId': group_name,
-                        'PropagateAtLaunch': bool(tag.get('propagate_at_launch', True))
-                    })
+    asg_tags = wanted_tags(module)
 
     if (not asg):
         if (not vpc_zone_identifier and not availability_zones):
-            availability_zones = [zone['ZoneName'] for zone in
-                                  ec2_connection.describe_availability_zones()['AvailabilityZones']]
+            availability_zones = get_availability_zones(ec2_connection, module)
             module.params['availability_zones'] = availability_zones
         enforce_required_arguments(module)
-        launch_config = asg_connection.describe_launch_configurations(LaunchConfigurationNames=[launch_config_name])[
-            'LaunchConfigurations'][0]['LaunchConfigurationName']
+        launch_args = launch_spec_args(module)
+        if (launch_config_name and not module.params.get('launch_template')):
+            launch_config = get_launch_config(asg_connection, module, launch_config_name)
+            if (launch_config is None):
+                module.fail_json(msg="No launch configuration named {0}".format(launch_config_name))
+            launch_args['LaunchConfigurationName'] = launch_config['LaunchConfigurationName']
         new_asg = {
             'AutoScalingGroupName': group_name,
-            'LaunchConfigurationName': launch_config,
             'MinSize': min_size,
             'MaxSize': max_size,
             'Tags': asg_tags,
@@ -523,6 +1680,7 @@ def create_autoscaling_group(asg_connection, ec2_connection, elb_connection, elb
             new_asg['LoadBalancerNames'] = load_balancers
         if (target_groups):
             new_asg['TargetGroupARNs'] = target_groups
+        new_asg.update(launch_args)
         if (desired_capacity):
             new_asg['DesiredCapacity'] = desired_capacity
         if (vpc_zone_identifier):
@@ -532,15 +1690,19 @@ def create_autoscaling_group(asg_connection, ec2_connection, elb_connection, elb
 
         try:
             asg_connection.create_auto_scaling_group(**new_asg)
-            if wait_for_instances:
-                wait_for_new_inst(module, asg_connection, group_name, wait_timeout, desired_capacity)
-                wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name, launch_config_name,
-                             min_size)
-
+            # before the first launches, so that their notifications can end the wait below
             if notification_topic:
                 asg_connection.put_notification_configuration(AutoScalingGroupName=group_name,
                                                               TopicARN=notification_topic,
                                                               NotificationTypes=notification_types)
+            warm_pool = warm_pool_args(module) if module.params.get('warm_pool') is not None else None
+            if (warm_pool is not None):
+                asg_connection.put_warm_pool(AutoScalingGroupName=group_name, **warm_pool)
+
+            if wait_for_instances:
+                asg = wait_for_new_inst(module, asg_connection, group_name, wait_timeout, desired_capacity)
+                wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name,
+                             get_launch_key(asg), min_size)
 
             asg = get_asg_by_name(asg_connection, group_name)
             changed = True
@@ -548,111 +1710,15 @@ def create_autoscaling_group(asg_connection, ec2_connection, elb_connection, elb
         except botocore.exceptions.ClientError as e:
             module.fail_json(msg="Failed to create Autoscaling Group: %s" % str(e), exception=traceback.format_exc(e))
     else:
-        changed = False
-        for attr in ANSIBLE_ASG_UPDATABLE_ATTRIBUTES:
-            if (module.params.get(attr, None) is not None):
-                module_attr = module.params.get(attr)
-                if (attr == 'vpc_zone_identifier'):
-                    module_attr = ','.join(module_attr)
-                group_attr = asg[ASG_ATTRIBUTES_MAP[attr]]
-                # we do this because AWS and the module may return the same list
-                # sorted differently
-                if (attr != 'termination_policies'):
-                    try:
-                        module_attr.sort()
-                    except:
-                        pass
-                    try:
-                        group_attr.sort()
-                    except:
-                        pass
-                if group_attr != module_attr:
-                    changed = True
-                    asg[ASG_ATTRIBUTES_MAP[attr]] = module_attr
-
-        if (tags != None):
-            existing_tags = asg['Tags']
-            want_tags = asg_tags
-            to_be_deleted_tags = []
-            for existing_tag in existing_tags:
-                check = True
-                for want_tag in want_tags:
-                    if (want_tag['Key'] == existing_tag['Key']):
-                        check = False
-                        break
-                if (check):
-                    to_be_deleted_tags.append(existing_tag)
-
-            if (to_be_deleted_tags):
-                args = {
-                    'Tags': to_be_deleted_tags
-                }
-                asg_connection.delete_tags(**args)
-
-            args = {
-                'Tags': asg_tags
-            }
-            asg_connection.create_or_update_tags(**args)
-
-        if (load_balancers != None):
-            existing_load_balancers = set(asg['LoadBalancerNames'])
-            want_load_balancers = set(load_balancers)
-            to_be_detached_load_balancers = existing_load_balancers.difference(want_load_balancers)
-            to_be_attached_load_balancers = want_load_balancers.difference(existing_load_balancers)
-            if (to_be_detached_load_balancers):
-                args = {
-                    'AutoScalingGroupName': group_name,
-                    'LoadBalancerNames': list(to_be_detached_load_balancers)
-                }
-                asg_connection.detach_load_balancers(**args)
-            if (to_be_attached_load_balancers):
-                args = {
-                    'AutoScalingGroupName': group_name,
-                    'LoadBalancerNames': list(to_be_attached_load_balancers)
-                }
-                asg_connection.attach_load_balancers(**args)
-
-        if (target_groups != None):
-            existing_target_groups = set(asg['TargetGroupARNs'])
-            want_target_groups = set(target_groups)
-            to_be_detached_target_groups = existing_target_groups.difference(want_target_groups)
-            to_be_attached_target_groups = want_target_groups.difference(existing_target_groups)
-            args = {
-                'AutoScalingGroupName': group_name,
-                'TargetGroupARNs': list(to_be_detached_target_groups)
-            }
-            asg_connection.detach_load_balancer_target_groups(**args)
-            args = {
-                'AutoScalingGroupName': group_name,
-                'TargetGroupARNs': list(to_be_attached_target_groups)
-            }
-            asg_connection.attach_load_balancer_target_groups(**args)
-
-        if (changed):
-            try:
-                updatable_asg = {}
-                for key in asg:
-                    if (key in ASG_UPDATABLE_ATTRIBUTES):
-                        updatable_asg[key] = asg[key]
-                if (updatable_asg['DesiredCapacity'] < updatable_asg['MinSize']):
-                    updatable_asg['DesiredCapacity'] = updatable_asg['MinSize']
-                if (updatable_asg['DesiredCapacity'] > updatable_asg['MaxSize']):
-                    updatable_asg['DesiredCapacity'] = updatable_asg['MaxSize']
-                asg_connection.update_auto_scaling_group(**updatable_asg)
-            except botocore.exceptions.ClientError as e:
-                module.fail_json(msg="Failed to update Autoscaling Group: %s" % str(e),
-                                 exception=traceback.format_exc(e))
-
-        if (notification_topic):
-            try:
-                asg_connection.put_notification_configuration(AutoScalingGroupName=group_name,
-                                                              TopicARN=notification_topic,
-                                                              NotificationTypes=notification_types)
-            except botocore.exceptions.ClientError as e:
-                module.fail_json(msg="Failed to update Autoscaling Group notifications: %s" % str(e),
-                                 exception=traceback.format_exc(e))
-
-        if (wait_for_instances):
+        if (launch_config_name and launch_config_name != asg.get('LaunchConfigurationName') and
+                get_launch_config(asg_connection, module, launch_config_name) is None):
+            module.fail_json(msg="No launch configuration named {0}".format(launch_config_name))
+        changes = group_diff(asg_connection, module, asg)
+        changed = bool(changes)
+        apply_group_diff(asg_connection, module, changes)
+
+        # a resumed replace() waits for the instances itself, knowing which of them it has deregistered
+        if (wait_for_instances and not resumes_replace(module, get_asg_by_name(asg_connection, group_name))):
             wait_for_new_inst(module, asg_connection, group_name, wait_timeout, desired_capacity)
             wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name)
         try:
@@ -660,35 +1726,324 @@ def create_autoscaling_group(asg_connection, ec2_connection, elb_connection, elb
         except botocore.exceptions.ClientError as e:
             module.fail_json(msg="Failed to read existing Autoscaling Groups: %s" % str(e),
                              exception=traceback.format_exc(e))
+        asg['changes'] = changes
         return (changed, asg)
 
 
-def delete_autoscaling_group(asg_connection, module):
+def updated_attributes(module, asg):
+    ''' Returns the attributes of asg, by their API name, whose value given in
+        the module params differs from the group's. '''
+    updated = {}
+    for attr in ANSIBLE_ASG_UPDATABLE_ATTRIBUTES:
+        if (module.params.get(attr, None) is not None):
+            module_attr = module.params.get(attr)
+            group_attr = asg.get(ASG_ATTRIBUTES_MAP[attr])
+            if (attr == 'vpc_zone_identifier'):
+                # AWS keeps the subnets as one comma separated string in its own order
+                if (set(module_attr) != set(subnet for subnet in (group_attr or '').split(',') if subnet)):
+                    updated[ASG_ATTRIBUTES_MAP[attr]] = ','.join(module_attr)
+                continue
+            # we do this because AWS and the module may return the same list
+            # sorted differently
+            if (attr != 'termination_policies'):
+                try:
+                    module_attr.sort()
+                except:
+                    pass
+                try:
+                    group_attr.sort()
+                except:
+                    pass
+            if group_attr != module_attr:
+                updated[ASG_ATTRIBUTES_MAP[attr]] = module_attr
+    return updated
+
+
+def wanted_tags(module):
+    ''' Returns the tags param as the Tags of the group, one per key. '''
+    asg_tags = []
+    if (module.params.get('tags') != None):
+        for tag in module.params.get('tags'):
+            for k, v in tag.items():
+                if (k != 'propagate_at_launch'):
+                    asg_tags.append({
+                        'Key': k,
+                        'Value': v,
+                        'ResourceType': 'auto-scaling-group',
+                        'ResourceId': module.params.get('name'),
+                        'PropagateAtLaunch': bool(tag.get('propagate_at_launch', True))
+                    })
+    return asg_tags
+
+
+def launch_spec_args(module):
+    ''' Returns what the group launches from as arguments of
+        create_auto_scaling_group and update_auto_scaling_group: the
+        LaunchConfigurationName, a LaunchTemplate, or a MixedInstancesPolicy
+        around the launch template when mixed_instances_policy is set. '''
+    launch_template = module.params.get('launch_template')
+    mixed_instances_policy = module.params.get('mixed_instances_policy')
+    if (launch_template and module.params.get('launch_config_name')):
+        module.fail_json(msg="launch_config_name and launch_template are mutually exclusive")
+    if (not launch_template):
+        if (mixed_instances_policy):
+            module.fail_json(msg="mixed_instances_policy requires launch_template")
+        if (module.params.get('launch_config_name')):
+            return {'LaunchConfigurationName': module.params.get('launch_config_name')}
+        return {}
+    if (launch_template.get('launch_template_id')):
+        spec = {'LaunchTemplateId': launch_template['launch_template_id']}
+    elif (launch_template.get('launch_template_name')):
+        spec = {'LaunchTemplateName': launch_template['launch_template_name']}
+    else:
+        module.fail_json(msg="launch_template needs launch_template_id or launch_template_name")
+    if (launch_template.get('version') is not None):
+        spec['Version'] = str(launch_template['version'])
+    if (not mixed_instances_policy):
+        return {'LaunchTemplate': spec}
+
+    policy = {'LaunchTemplate': {'LaunchTemplateSpecification': spec}}
+    overrides = []
+    for instance_type in mixed_instances_policy.get('instance_types') or []:
+        if (isinstance(instance_type, string_types)):
+            overrides.append({'InstanceType': instance_type})
+            continue
+        override = {'InstanceType': instance_type['instance_type']}
+        if (instance_type.get('weighted_capacity') is not None):
+            override['WeightedCapacity'] = str(instance_type['weighted_capacity'])
+        overrides.append(override)
+    if (overrides):
+        policy['LaunchTemplate']['Overrides'] = overrides
+    if (mixed_instances_policy.get('instances_distribution')):
+        policy['InstancesDistribution'] = snake_dict_to_camel_dict(mixed_instances_policy['instances_distribution'],
+                                                                   capitalize_first=True)
+    return {'MixedInstancesPolicy': policy}
+
+
+def warm_pool_args(module):
+    ''' Returns the warm_pool param as arguments of put_warm_pool, or None
+        when the pool is to be deleted. '''
+    warm_pool = module.params.get('warm_pool')
+    if (warm_pool.get('state') == 'absent'):
+        return None
+    args = {'MinSize': warm_pool.get('min_size') or 0, 'PoolState': warm_pool.get('pool_state') or 'Stopped'}
+    if (warm_pool.get('max_group_prepared_capacity') is not None):
+        args['MaxGroupPreparedCapacity'] = warm_pool['max_group_prepared_capacity']
+    if (warm_pool.get('reuse_on_scale_in') is not None):
+        args['InstanceReusePolicy'] = {'ReuseOnScaleIn': bool(warm_pool['reuse_on_scale_in'])}
+    return args
+
+
+def group_launch_args(asg):
+    ''' Returns what asg launches from as arguments of
+        create_auto_scaling_group, for a group to launch the same. '''
+    if (asg.get('MixedInstancesPolicy')):
+        policy = copy.deepcopy(asg['MixedInstancesPolicy'])
+        spec = policy['LaunchTemplate']['LaunchTemplateSpecification']
+        if (spec.get('LaunchTemplateId')):
+            # only one of the id and the name may be given
+            spec.pop('LaunchTemplateName', None)
+        return {'MixedInstancesPolicy': policy}
+    if (asg.get('LaunchTemplate')):
+        spec = dict(asg['LaunchTemplate'])
+        if (spec.get('LaunchTemplateId')):
+            spec.pop('LaunchTemplateName', None)
+        return {'LaunchTemplate': spec}
+    return {'LaunchConfigurationName': asg['LaunchConfigurationName']}
+
+
+def contains(actual, wanted):
+    ''' Tells whether the API value actual has everything of wanted: dicts
+        may have more keys, lists have to match item by item. '''
+    if (isinstance(wanted, dict)):
+        return (isinstance(actual, dict) and
+                all(contains(actual.get(key), value) for key, value in wanted.items()))
+    if (isinstance(wanted, list)):
+        return (isinstance(actual, list) and len(actual) == len(wanted) and
+                all(contains(a, w) for a, w in zip(actual, wanted)))
+    return actual == wanted
+
+
+def get_notification_types(asg_connection, group_name, topic):
+    ''' Returns the sorted notification types the group sends to topic. '''
+    notification_types = []
+    args = {'AutoScalingGroupNames': [group_name]}
+    while True:
+        response = asg_connection.describe_notification_configurations(**args)
+        notification_types.extend(configuration['NotificationType'] for configuration in
+                                  response['NotificationConfigurations'] if configuration['TopicARN'] == topic)
+        if (not response.get('NextToken')):
+            return sorted(notification_types)
+        args['NextToken'] = response['NextToken']
+
+
+def group_diff(asg_connection, module, asg):
+    ''' Compares an existing group with the module params and returns what
+        has to change, by kind: 'attributes' maps each API attribute to its
+        before and after value, 'tags' lists the tags to create or update and
+        those to delete, 'load_balancers' and 'target_groups' list what to
+        attach and detach, 'warm_pool' holds the configuration of the warm
+        pool before and after (None without a pool), and 'notifications'
+        holds the types sent to notification_topic before and after. A kind that already matches is
+        left out, so an empty dict means the group is up to date. '''
     group_name = module.params.get('name')
-    notification_topic = module.params.get('notification_topic')
+    changes = {}
+
+    updated = updated_attributes(module, asg)
+    if (module.params.get('launch_template')):
+        for key, value in launch_spec_args(module).items():
+            if (not contains(asg.get(key), value)):
+                updated[key] = value
+    if (resumes_replace(module, dict(asg, **updated))):
+        # replace() sets the sizes the replacement had reached and puts these back once it completes
+        for key in ('MinSize', 'MaxSize', 'DesiredCapacity'):
+            updated.pop(key, None)
+    sizes = dict((key, updated.get(key, asg[key])) for key in ('MinSize', 'MaxSize', 'DesiredCapacity'))
+    desired_capacity = min(max(sizes['DesiredCapacity'], sizes['MinSize']), sizes['MaxSize'])
+    if (desired_capacity != asg['DesiredCapacity']):
+        updated['DesiredCapacity'] = desired_capacity
+    else:
+        updated.pop('DesiredCapacity', None)
+    if (updated):
+        changes['attributes'] = dict((key, {'before': asg.get(key), 'after': value}) for key, value in updated.items())
+
+    if (module.params.get('tags') != None):
+        want = dict((tag['Key'], tag) for tag in wanted_tags(module))
+        have = dict((tag['Key'], tag) for tag in asg['Tags'])
+        create = [want[key] for key in sorted(want) if key not in have or
+                  (str(have[key]['Value']), have[key]['PropagateAtLaunch']) !=
+                  (str(want[key]['Value']), want[key]['PropagateAtLaunch'])]
+        delete = [have[key] for key in sorted(have) if key not in want]
+        if (create or delete):
+            changes['tags'] = {'create': create, 'delete': delete}
+
+    for kind, key in (('load_balancers', 'LoadBalancerNames'), ('target_groups', 'TargetGroupARNs')):
+        if (module.params.get(kind) != None):
+            want = set(module.params.get(kind))
+            have = set(asg[key])
+            if (want != have):
+                changes[kind] = {'attach': sorted(want - have), 'detach': sorted(have - want)}
+
+    if (module.params.get('warm_pool') is not None):
+        before = asg.get('WarmPoolConfiguration')
+        after = warm_pool_args(module)
+        if ((after is None and before) or (after is not None and not contains(before, after))):
+            changes['warm_pool'] = {'before': before, 'after': after}
 
+    notification_topic = module.params.get('notification_topic')
     if (notification_topic):
-        asg_connection.delete_notification_configuration(AutoScalingGroupName=group_name, TopicARN=notification_topic)
+        before = get_notification_types(asg_connection, group_name, notification_topic)
+        after = sorted(module.params.get('notification_types'))
+        if (before != after):
+            changes['notifications'] = {'topic': notification_topic, 'before': before, 'after': after}
+    return changes
+
+
+def apply_group_diff(asg_connection, module, changes):
+    ''' Makes the writes that group_diff found necessary, and only those,
+        splitting the lists of every call at API_BATCH_LIMITS. '''
+    group_name = module.params.get('name')
+    if ('tags' in changes):
+        for tags in get_chunks(changes['tags']['delete'], API_BATCH_LIMITS['tags']):
+            asg_connection.delete_tags(Tags=tags)
+        for tags in get_chunks(changes['tags']['create'], API_BATCH_LIMITS['tags']):
+            asg_connection.create_or_update_tags(Tags=tags)
+
+    if ('load_balancers' in changes):
+        for load_balancers in get_chunks(changes['load_balancers']['detach'], API_BATCH_LIMITS['load_balancers']):
+            asg_connection.detach_load_balancers(AutoScalingGroupName=group_name, LoadBalancerNames=load_balancers)
+        for load_balancers in get_chunks(changes['load_balancers']['attach'], API_BATCH_LIMITS['load_balancers']):
+            asg_connection.attach_load_balancers(AutoScalingGroupName=group_name, LoadBalancerNames=load_balancers)
+
+    if ('target_groups' in changes):
+        for target_groups in get_chunks(changes['target_groups']['detach'], API_BATCH_LIMITS['target_groups']):
+            asg_connection.detach_load_balancer_target_groups(AutoScalingGroupName=group_name,
+                                                              TargetGroupARNs=target_groups)
+        for target_groups in get_chunks(changes['target_groups']['attach'], API_BATCH_LIMITS['target_groups']):
+            asg_connection.attach_load_balancer_target_groups(AutoScalingGroupName=group_name,
+                                                              TargetGroupARNs=target_groups)
+
+    if ('attributes' in changes):
+        try:
+            updatable_asg = dict((key, value['after']) for key, value in changes['attributes'].items())
+            updatable_asg['AutoScalingGroupName'] = group_name
+            asg_connection.update_auto_scaling_group(**updatable_asg)
+        except botocore.exceptions.ClientError as e:
+            module.fail_json(msg="Failed to update Autoscaling Group: %s" % str(e),
+                             exception=traceback.format_exc())
+
+    if ('warm_pool' in changes):
+        try:
+            if (changes['warm_pool']['after'] is None):
+                asg_connection.delete_warm_pool(AutoScalingGroupName=group_name)
+            else:
+                asg_connection.put_warm_pool(AutoScalingGroupName=group_name, **changes['warm_pool']['after'])
+        except botocore.exceptions.ClientError as e:
+            module.fail_json(msg="Failed to update the warm pool of Autoscaling Group: %s" % str(e),
+                             exception=traceback.format_exc())
+
+    if ('notifications' in changes):
+        try:
+            asg_connection.put_notification_configuration(AutoScalingGroupName=group_name,
+                                                          TopicARN=changes['notifications']['topic'],
+                                                          NotificationTypes=changes['notifications']['after'])
+        except botocore.exceptions.ClientError as e:
+            module.fail_json(msg="Failed to update Autoscaling Group notifications: %s" % str(e),
+                             exception=traceback.format_exc())
+
+
+def delete_autoscaling_group(asg_connection, module):
+    ''' Deletes the group and returns (changed, properties), where
+        properties reports how long the group took to drain of instances and
+        to be deleted, or is None when there was no group. The group is
+        scaled to zero and deleted once empty, or with force_delete deleted
+        straight away along with its instances. Both waits together are
+        bounded by wait_timeout. '''
+    group_name = module.params.get('name')
+    notification_topic = module.params.get('notification_topic')
+    wait_timeout = module.params.get('wait_timeout')
+    force_delete = module.params.get('force_delete')
 
     asg = get_asg_by_name(asg_connection, group_name)
     if (asg):
-        update_size(asg_connection, asg, 0, 0, 0)
-        instances = True
-        while (instances):
-            tmp_group = get_asg_by_name(asg_connection, group_name)
-            if (tmp_group):
-                if (not tmp_group['Instances']):
-                    instances = False
-            time.sleep(10)
-
-        asg_connection.delete_auto_scaling_group(AutoScalingGroupName=group_name)
-        while (get_asg_by_name(asg_connection, group_name)):
-            time.sleep(5)
+        if (notification_topic):
+            asg_connection.delete_notification_configuration(AutoScalingGroupName=group_name,
+                                                             TopicARN=notification_topic)
+        waiter = get_waiter(module)
+        started = time.time()
+
+        def gone():
+            return not get_asg_by_name(asg_connection, group_name)
+
+        if (force_delete):
+            asg_connection.delete_auto_scaling_group(AutoScalingGroupName=group_name, ForceDelete=True)
+            # the group goes away once its instances have terminated
+            if (not waiter.wait(gone, asg_connection, group_name, wait_timeout)):
+                module.fail_json(msg="Waited too long for {0} to be deleted. {1}".format(group_name, time.asctime()))
+            drain_seconds = time.time() - started
+        else:
+            if (asg.get('WarmPoolConfiguration')):
+                # a group with a warm pool can only be deleted by force
+                asg_connection.delete_warm_pool(AutoScalingGroupName=group_name, ForceDelete=True)
+            update_size(asg_connection, asg, 0, 0, 0)
+
+            def drained():
+                tmp_group = get_asg_by_name(asg_connection, group_name)
+                return (not tmp_group) or (not tmp_group['Instances'] and not tmp_group.get('WarmPoolSize'))
+
+            if (not waiter.wait(drained, asg_connection, group_name, wait_timeout)):
+                module.fail_json(msg="Waited too long for instances of {0} to terminate. {1}".format(group_name,
+                                                                                                     time.asctime()))
+            drain_seconds = time.time() - started
+            asg_connection.delete_auto_scaling_group(AutoScalingGroupName=group_name)
+            if (not waiter.wait(gone, asg_connection, group_name, max(wait_timeout - drain_seconds, 0))):
+                module.fail_json(msg="Waited too long for {0} to be deleted. {1}".format(group_name, time.asctime()))
         changed = True
-        return changed
+        return (changed, {'drain_seconds': round(drain_seconds, 1),
+                          'delete_seconds': round(time.time() - started, 1)})
     else:
         changed = False
-        return changed
+        return (changed, None)
 
 
 def get_chunks(l, n):
@@ -697,149 +2052,757 @@ def get_chunks(l, n):
 
 
 def update_size(asg_connection, asg, max_size, min_size, dc):
-    log.debug("setting ASG sizes")
-    log.debug("minimum size: {0}, desired_capacity: {1}, max size: {2}".format(min_size, dc, max_size))
-    asg['MaxSize'] = max_size
-    asg['MinSize'] = min_size
-    asg['DesiredCapacity'] = dc
-    updatable_asg = {}
-    for key in asg:
-        if (key in ASG_UPDATABLE_ATTRIBUTES):
-            updatable_asg[key] = asg[key]
-    asg_connection.update_auto_scaling_group(**updatable_asg)
+    with get_metrics(asg_connection).phase('update_size'):
+        log.debug("setting ASG sizes")
+        log.debug("minimum size: {0}, desired_capacity: {1}, max size: {2}".format(min_size, dc, max_size))
+        asg['MaxSize'] = max_size
+        asg['MinSize'] = min_size
+        asg['DesiredCapacity'] = dc
+        updatable_asg = {}
+        for key in asg:
+            if (key in ASG_UPDATABLE_ATTRIBUTES):
+                updatable_asg[key] = asg[key]
+        asg_connection.update_auto_scaling_group(**updatable_asg)
+
+
+class BatchSizer(object):
+    ''' Picks the size of each batch of replace(). In fixed mode it stays at
+        replace_batch_size. In adaptive mode replace_batch_size is only the
+        first batch: the size doubles after every batch that passes its
+        health gates and halves after one that was slow (used more than half
+        of wait_timeout) or failed its health gate, never exceeding
+        replace_batch_max_size or replace_batch_max_percent of the desired
+        capacity. Every batch is recorded in history. '''
+
+    def __init__(self, module, desired_capacity):
+        self.adaptive = module.params.get('replace_batch_mode') == 'adaptive'
+        self.size = max(module.params.get('replace_batch_size'), 1)
+        self.slow_seconds = module.params.get('wait_timeout') / 2.0
+        self.max_size = max(desired_capacity, 1)
+        max_batch_size = module.params.get('replace_batch_max_size')
+        max_batch_percent = module.params.get('replace_batch_max_percent')
+        if (max_batch_size):
+            self.max_size = min(self.max_size, max_batch_size)
+        if (max_batch_percent):
+            self.max_size = min(self.max_size, max(int(desired_capacity * max_batch_percent / 100.0), 1))
+        if (self.adaptive):
+            self.size = min(self.size, self.max_size)
+        self.history = []
+
+    def cap(self, size):
+        self.size = max(min(self.size, size), 1)
+
+    def record(self, instances, seconds, healthy):
+        self.history.append({
+            'batch': len(self.history) + 1,
+            'batch_size': self.size,
+            'instances': instances,
+            'seconds': int(seconds),
+            'healthy': healthy
+        })
+        if (not self.adaptive):
+            return self.size
+        if (not healthy or seconds > self.slow_seconds):
+            self.size = max(self.size // 2, 1)
+        else:
+            self.size = min(self.size * 2, self.max_size)
+        log.debug("Next batch size: {0}".format(self.size))
+        return self.size
+
+
+class ReplaceCheckpoint(object):
+    ''' Progress of one rolling update of a group, kept in checkpoint_file.
+        The state is rewritten after every step, so a run that failed or was
+        interrupted leaves behind where it stopped. A checkpoint is only
+        picked up for the same group and launch config or template. '''
+
+    def __init__(self, module, group_name, launch_key):
+        self.module = module
+        self.path = module.params.get('checkpoint_file')
+        self.key = {'group_name': group_name, 'launch_key': launch_key}
+        self.state = None
+
+    def load(self):
+        if (not self.path or not os.path.exists(self.path)):
+            return None
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            log.debug("Ignoring unreadable checkpoint {0}: {1}".format(self.path, str(e)))
+            return None
+        if (any(state.get(key) != value for key, value in self.key.items())):
+            log.debug("Ignoring checkpoint {0} of another update: {1}".format(self.path, state))
+            return None
+        self.state = state
+        return state
+
+    def save(self, **changes):
+        if (not self.path):
+            return
+        if (self.state is None):
+            self.state = dict(self.key, completed_batches=0, pending_terminations=[], decrements={}, wait=None)
+        self.state.update(changes)
+        try:
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.state, f, sort_keys=True)
+            os.rename(self.path + '.tmp', self.path)
+        except (IOError, OSError) as e:
+            self.module.fail_json(msg="Failed to write checkpoint {0}: {1}".format(self.path, str(e)))
+
+    def remove(self):
+        if (self.path and os.path.exists(self.path)):
+            os.remove(self.path)
+
+
+def resumes_replace(module, asg):
+    ''' Whether replace() will resume a rolling replacement of asg, as it
+        is once updated, from its checkpoint. '''
+    if (module.params.get('replace_mode') != 'rolling' or
+            not (module.params.get('replace_all_instances') or module.params.get('replace_instances'))):
+        return False
+    return ReplaceCheckpoint(module, asg['AutoScalingGroupName'], get_launch_key(asg)).load() is not None
+
+
+def pipeline_lead(asg_connection, module, initial_instances, desired_capacity, batch_size, headroom):
+    ''' Number of replacements for the batch after the current one that can be
+        launched while the current one drains: one batch worth, no more than
+        will still be needed after the current batch, and no more than the
+        headroom left under the maximum surge. '''
+    asg = get_asg_by_name(asg_connection, module.params.get('name'))
+    index = get_instance_index(asg)
+    new_instances, old_instances = get_instances_by_lc(asg, module.params.get('lc_check'), initial_instances, index)
+    num_new_inst_needed = desired_capacity - index.capacity(instance_ids(new_instances))
+    return max(min(batch_size, num_new_inst_needed - batch_size, headroom), 0)
 
 
 def replace(asg_connection, elb_connection, elb2_connection, module):
-    batch_size = module.params.get('replace_batch_size')
     wait_timeout = module.params.get('wait_timeout')
     group_name = module.params.get('name')
-    launch_config_name = module.params.get('launch_config_name')
     lc_check = module.params.get('lc_check')
+    # what the update part of this run has just set the group to launch from
+    launch_key = get_launch_key(get_asg_by_name(asg_connection, group_name))
+    # the health gates count the instances launched from it, unless the old ones may be too
+    health_key = None
+    if (lc_check or module.params.get('launch_config_name') or module.params.get('launch_template')):
+        health_key = launch_key
     replace_instances = module.params.get('replace_instances')
-
-    asg = get_asg_by_name(asg_connection, group_name)
-    wait_for_new_inst(module, asg_connection, group_name, wait_timeout, asg['MinSize'])
-    instances = asg['Instances']
-    if (replace_instances):
-        instances = []
-        for replace_instance in replace_instances:
-            instances.append({'InstanceId': replace_instance})
-    # check to see if instances are replaceable if checking launch configs
-
-    # check if min_size/max_size/desired capacity have been specified and if not use ASG values
-    min_size = asg['MinSize']
-    max_size = asg['MaxSize']
-    desired_capacity = asg['DesiredCapacity']
-
-    new_instances, old_instances = get_instances_by_lc(asg, lc_check, instances)
-    num_new_inst_needed = desired_capacity - len(new_instances)
-
-    if (lc_check):
-        if (num_new_inst_needed == 0 and old_instances):
-            log.debug("No new instances needed, but old instances are present. Removing old instances")
-            terminate_batch(asg_connection, elb_connection, elb2_connection, module, min_size, desired_capacity,
-                            old_instances, instances, True)
-            asg = get_asg_by_name(asg_connection, group_name)
-            changed = True
+    pipeline = module.params.get('replace_pipeline')
+    max_surge = module.params.get('replace_max_surge')
+    checkpoint = ReplaceCheckpoint(module, group_name, launch_key)
+    progress = get_progress(module)
+    replace_started = time.time()
+    state = checkpoint.load()
+
+    if (state):
+        log.debug("Resuming rolling update from checkpoint: {0}".format(state))
+        min_size = state['min_size']
+        max_size = state['max_size']
+        desired_capacity = state['desired_capacity']
+        sizer = BatchSizer(module, desired_capacity)
+        sizer.size = state['batch_size']
+        sizer.history = state['history']
+        surge = state['surge']
+        lead = state['lead']
+        minimal_instance = state['minimal_instance']
+        position = state['position']
+        completed_batches = state['completed_batches']
+        warm_pool = state.get('warm_pool')
+        instances = [{'InstanceId': instance_id} for instance_id in state['instances']]
+        progress.emit('replace_start', resumed=True, instances=len(instances) - position, batch_size=sizer.size,
+                      desired_capacity=desired_capacity)
+        # the update part of this run may have put the sizes back; terminations of a batch the
+        # run stopped in have already decremented the desired capacity by as much as they applied
+        asg = get_asg_by_name(asg_connection, group_name)
+        index = get_instance_index(asg)
+        pending = [{'InstanceId': instance_id} for instance_id in state['pending_terminations']]
+        unterminated = list_purgeable_instances(asg, False, pending, pending, index)
+        decrements = state['decrements']
+        applied = sum(capacity for instance_id, capacity in decrements.items()
+                      if (instance_id not in instance_ids(unterminated)))
+        max_group_size, min_group_size, desired_group_size = state['sizes']
+        update_size(asg_connection, asg, max_group_size, min_group_size, desired_group_size - applied)
+        if (unterminated):
+            log.debug("Finishing the terminations of {0}".format(instance_ids(unterminated)))
+            terminate_instances(asg_connection, elb_connection, elb2_connection, module, unterminated, decrements)
+        if (pending):
+            wait_for_term_inst(asg_connection, module, pending)
+        if (state['wait']):
+            wait_for_new_inst(module, asg_connection, group_name, wait_timeout, state['wait']['desired_size'])
+            wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name, health_key,
+                         state['wait']['minimal_instance'])
+            if (state['pending_terminations']):
+                completed_batches += 1
+            checkpoint.save(completed_batches=completed_batches, pending_terminations=[], decrements={},
+                            sizes=[max_group_size, min_group_size, desired_group_size - applied], wait=None)
+        if (state.get('break_early')):
+            position = len(instances)
+    else:
+        asg = get_asg_by_name(asg_connection, group_name)
+        if (replace_converged(asg, module)):
+            log.debug("No instance of {0} needs replacing.".format(group_name))
+            progress.emit('converged')
+            changed = False
+            return (changed, asg)
+        wait_for_new_inst(module, asg_connection, group_name, wait_timeout, asg['MinSize'])
+        instances = asg['Instances']
+        if (replace_instances):
+            instances = []
+            for replace_instance in replace_instances:
+                instances.append({'InstanceId': replace_instance})
+        # check to see if instances are replaceable if checking launch configs
+
+        # check if min_size/max_size/desired capacity have been specified and if not use ASG values
+        min_size = asg['MinSize']
+        max_size = asg['MaxSize']
+        desired_capacity = asg['DesiredCapacity']
+        sizer = BatchSizer(module, desired_capacity)
+
+        index = get_instance_index(asg)
+        new_instances, old_instances = get_instances_by_lc(asg, lc_check, instances, index)
+        num_new_inst_needed = desired_capacity - index.capacity(instance_ids(new_instances))
+
+        if (lc_check):
+            if (num_new_inst_needed == 0 and old_instances):
+                log.debug("No new instances needed, but old instances are present. Removing old instances")
+                terminate_batch(asg_connection, elb_connection, elb2_connection, module, min_size, desired_capacity,
+                                old_instances, instances, True, sizer.size)
+                asg = get_asg_by_name(asg_connection, group_name)
+                progress.emit('replace_end', batches=0, seconds=round(time.time() - replace_started, 1))
+                changed = True
+                return (changed, asg)
+
+            # we don't want to spin up extra instances if not necessary
+            if (num_new_inst_needed < sizer.size):
+                log.debug("Overriding batch size to {0}".format(num_new_inst_needed))
+                sizer.cap(num_new_inst_needed)
+
+        if (not old_instances):
+            changed = False
             return (changed, asg)
 
-        # we don't want to spin up extra instances if not necessary
-        if (num_new_inst_needed < batch_size):
-            log.debug("Overriding batch size to {0}".format(num_new_inst_needed))
-            batch_size = num_new_inst_needed
-
-    if (not old_instances):
-        changed = False
-        return (changed, asg)
-
-    # set temporary settings and wait for them to be reached
-    # This should get overwritten if the number of instances left is less than the batch size.
-
-    minimal_instance = len(new_instances) + batch_size
-    asg = get_asg_by_name(asg_connection, group_name)
-    update_size(asg_connection, asg, max_size + batch_size, min_size + batch_size, desired_capacity + batch_size)
-    wait_for_new_inst(module, asg_connection, group_name, wait_timeout, asg['MinSize'])
-    wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name, launch_config_name, minimal_instance)
+        # set temporary settings and wait for them to be reached
+        # This should get overwritten if the number of instances left is less than the batch size.
 
-    asg = get_asg_by_name(asg_connection, group_name)
-    instances = asg['Instances']
-    if (replace_instances):
-        instances = []
-        for replace_instance in replace_instances:
-            instances.append({'InstanceId': replace_instance})
+        surge = sizer.size
+        minimal_instance = index.capacity(instance_ids(new_instances)) + surge
+        asg = get_asg_by_name(asg_connection, group_name)
+        instances = asg['Instances']
+        if (replace_instances):
+            instances = []
+            for replace_instance in replace_instances:
+                instances.append({'InstanceId': replace_instance})
+        # every batch takes evenly from the zones so the group never needs rebalancing
+        instances = az_balanced_instances(asg, lc_check, instances)
+        warm_pool = prepare_warm_pool(asg_connection, module, asg, get_launch_key(asg), surge)
+        # replacements launched ahead of their batch when pipelining
+        lead = 0
+        position = 0
+        completed_batches = 0
+        progress.emit('replace_start', resumed=False, instances=len(old_instances), batch_size=sizer.size,
+                      desired_capacity=desired_capacity)
+        checkpoint.save(min_size=min_size, max_size=max_size, desired_capacity=desired_capacity,
+                        instances=[instance['InstanceId'] for instance in instances], position=position,
+                        surge=surge, lead=lead, batch_size=sizer.size, history=sizer.history,
+                        minimal_instance=minimal_instance, warm_pool=warm_pool,
+                        sizes=[max_size + surge, min_size + surge, desired_capacity + surge],
+                        wait={'desired_size': min_size + surge, 'minimal_instance': minimal_instance})
+        update_size(asg_connection, asg, max_size + surge, min_size + surge, desired_capacity + surge)
+        wait_for_new_inst(module, asg_connection, group_name, wait_timeout, asg['MinSize'])
+        wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name, health_key,
+                     minimal_instance)
+        checkpoint.save(wait=None)
+
+    if (max_surge is None):
+        max_surge = 2 * surge
+        if (sizer.adaptive):
+            max_surge = max(max_surge, sizer.max_size)
 
     log.debug("beginning main loop")
 
-    for i in get_chunks(instances, batch_size):
+    while (position < len(instances)):
+        if (sizer.adaptive):
+            # a batch larger than the new capacity still needed, once the extra capacity for it is
+            # raised, would pass over old instances without terminating them and leave the group
+            # with surplus instances; nor may the extra capacity exceed max_surge
+            asg = get_asg_by_name(asg_connection, group_name)
+            index = get_instance_index(asg)
+            new_instances, old_instances = get_instances_by_lc(asg, lc_check, instances, index)
+            num_new_inst_needed = desired_capacity - index.capacity(instance_ids(new_instances))
+            if (num_new_inst_needed > surge):
+                sizer.cap(min((num_new_inst_needed + surge) // 2, max(max_surge - lead, surge)))
+            else:
+                sizer.cap(num_new_inst_needed)
+        batch_size = sizer.size
+        if (batch_size > surge):
+            # an adaptive batch outgrew the extra capacity raised so far
+            minimal_instance = minimal_instance + batch_size - surge
+            surge = batch_size
+            checkpoint.save(surge=surge, minimal_instance=minimal_instance,
+                            sizes=[max_size + surge + lead, min_size + surge, desired_capacity + surge + lead])
+            asg = get_asg_by_name(asg_connection, group_name)
+            update_size(asg_connection, asg, max_size + surge + lead, min_size + surge, desired_capacity + surge + lead)
+        next_lead = 0
+        if (pipeline):
+            next_lead = pipeline_lead(asg_connection, module, instances, desired_capacity, batch_size,
+                                      max_size + max_surge - (desired_capacity + surge + lead))
+        if (next_lead):
+            # let the next batch's replacements boot while this batch drains
+            log.debug("Launching {0} instances ahead of the next batch".format(next_lead))
+            checkpoint.save(sizes=[max_size + surge + lead + next_lead, min_size + surge,
+                                   desired_capacity + surge + lead + next_lead])
+            asg = get_asg_by_name(asg_connection, group_name)
+            update_size(asg_connection, asg, max_size + surge + lead + next_lead, min_size + surge,
+                        desired_capacity + surge + lead + next_lead)
+        # batch_size is capacity, which the old instances may count for more or less than one each
+        index = get_instance_index(get_asg_by_name(asg_connection, group_name))
+        i = index.up_to(instances[position:], batch_size)
+        position = position + len(i)
+        batch_started = time.time()
+        progress.emit('batch_start', batch=completed_batches + 1, batch_size=batch_size,
+                      instances=[instance['InstanceId'] for instance in i])
         # break out of this loop if we have enough new instances
-        break_early, desired_size, term_instances = terminate_batch(asg_connection, elb_connection, elb2_connection,
-                                                                    module, min_size, desired_capacity, i, instances,
-                                                                    False)
+        break_early, desired_size, term_instances, decrements = batch_terminations(
+            asg_connection, module, min_size, desired_capacity, i, instances, False, batch_size, lead)
+        asg = get_asg_by_name(asg_connection, group_name)
+        sizes = [asg['MaxSize'], asg['MinSize'], asg['DesiredCapacity']]
+        lead = next_lead
+        terminated = index.capacity(instance_ids(term_instances))
         if (not break_early):
-            minimal_instance = minimal_instance + len(term_instances)
+            minimal_instance = minimal_instance + terminated
+        # recorded before any of the batch is deregistered, so that a run stopped halfway through it
+        # can finish its terminations and knows how far they have decremented the desired capacity
+        checkpoint.save(position=position, surge=surge, lead=lead, minimal_instance=minimal_instance,
+                        break_early=break_early, sizes=sizes,
+                        pending_terminations=[instance['InstanceId'] for instance in term_instances],
+                        decrements=decrements,
+                        wait={'desired_size': desired_size, 'minimal_instance': minimal_instance})
+        terminate_instances(asg_connection, elb_connection, elb2_connection, module, term_instances, decrements)
         wait_for_term_inst(asg_connection, module, term_instances)
         wait_for_new_inst(module, asg_connection, group_name, wait_timeout, desired_size)
-        wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name, launch_config_name, minimal_instance)
+        healthy = wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name, health_key,
+                               minimal_instance, fail=not sizer.adaptive)
+        if (not healthy):
+            # shrink before giving the health gate a second chance
+            sizer.record(terminated, time.time() - batch_started, False)
+            wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name, health_key,
+                         minimal_instance)
+        else:
+            sizer.record(terminated, time.time() - batch_started, True)
+        completed_batches += 1
+        progress.emit('batch_end', batch=completed_batches, terminated=len(term_instances), healthy=bool(healthy),
+                      seconds=round(time.time() - batch_started, 1), remaining_instances=len(instances) - position)
+        sizes[2] = sizes[2] - sum(decrements.values())
+        checkpoint.save(completed_batches=completed_batches, batch_size=sizer.size, history=sizer.history,
+                        sizes=sizes, pending_terminations=[], decrements={}, wait=None)
         if (break_early):
             log.debug("breaking loop")
             break
     asg = get_asg_by_name(asg_connection, group_name)
     update_size(asg_connection, asg, max_size, min_size, desired_capacity)
+    restore_warm_pool(asg_connection, group_name, warm_pool)
     asg = get_asg_by_name(asg_connection, group_name)
+    checkpoint.remove()
+    progress.emit('replace_end', batches=completed_batches, seconds=round(time.time() - replace_started, 1))
+    if (sizer.adaptive):
+        asg['batch_size_history'] = sizer.history
     log.debug("Rolling update complete.")
     changed = True
     return (changed, asg)
 
 
-def get_instances_by_lc(asg, lc_check, initial_instances):
-    new_instances = []
-    old_instances = []
-    # old instances are those that have the old launch config
-    if (lc_check):
-        for i in asg['Instances']:
-            if (('LaunchConfigurationName' in i) and (i['LaunchConfigurationName'] == asg['LaunchConfigurationName'])):
-                new_instances.append(i)
-            else:
-                old_instances.append(i)
+def get_warm_pool_instances(asg_connection, group_name):
+    ''' The instances in the warm pool of the group. '''
+    instances = []
+    args = {'AutoScalingGroupName': group_name, 'MaxRecords': 50}
+    while True:
+        response = asg_connection.describe_warm_pool(**args)
+        instances.extend(response.get('Instances', []))
+        if (not response.get('NextToken')):
+            return instances
+        args['NextToken'] = response['NextToken']
+
+
+def prepare_warm_pool(asg_connection, module, asg, launch_key, surge):
+    ''' Readies the warm pool of asg, if it has one, to supply the
+        replacements of replace(). Instances warmed from another launch
+        config or template are terminated, as the group would otherwise bring
+        them into service, and the pool's MinSize is raised to surge so that
+        a batch worth stays warm while the group refills the pool in the
+        background. Returns the pool's configuration as it was, for
+        restore_warm_pool, or None without a pool. '''
+    pool = asg.get('WarmPoolConfiguration')
+    if (not pool or pool.get('Status') == 'PendingDelete'):
+        return None
+    group_name = asg['AutoScalingGroupName']
+    stale = [instance['InstanceId'] for instance in get_warm_pool_instances(asg_connection, group_name)
+             if (get_launch_key(instance) != launch_key and
+                 not instance['LifecycleState'].startswith('Warmed:Terminat'))]
+    for instance_id in stale:
+        asg_connection.terminate_instance_in_auto_scaling_group(InstanceId=instance_id,
+                                                                ShouldDecrementDesiredCapacity=False)
+    min_size = max(pool.get('MinSize', 0), surge)
+    if (min_size != pool.get('MinSize', 0)):
+        asg_connection.put_warm_pool(AutoScalingGroupName=group_name,
+                                     **dict(warm_pool_config(pool), MinSize=min_size))
+    log.debug("Warm pool of {0}: terminated {1} stale instances, minimum size {2}".format(group_name, len(stale),
+                                                                                         min_size))
+    get_progress(module).emit('warm_pool', terminated=stale, min_size=min_size)
+    return pool
+
+
+def restore_warm_pool(asg_connection, group_name, pool):
+    ''' Puts back the warm pool configuration prepare_warm_pool changed. '''
+    if (pool is None):
+        return
+    asg = get_asg_by_name(asg_connection, group_name)
+    if (not contains(asg.get('WarmPoolConfiguration'), warm_pool_config(pool))):
+        asg_connection.put_warm_pool(AutoScalingGroupName=group_name, **warm_pool_config(pool))
 
-    else:
+
+def warm_pool_config(pool):
+    ''' The arguments of put_warm_pool that recreate pool, a
+        WarmPoolConfiguration as AWS describes it. '''
+    return dict((key, pool[key]) for key in ('MinSize', 'MaxGroupPreparedCapacity', 'PoolState',
+                                             'InstanceReusePolicy') if key in pool)
+
+
+def replace_converged(asg, module):
+    ''' Tells from one snapshot of the group whether replace() has nothing
+        to do: with lc_check no instance is on a launch config other than the
+        group's, and without it none of replace_instances (or, when replacing
+        all instances, no instance at all) is left in the group. '''
+    index = get_instance_index(asg)
+    replace_instances = module.params.get('replace_instances')
+    initial_ids = set(replace_instances) if replace_instances else index.ids
+    new_ids, old_ids = index.split(module.params.get('lc_check'), initial_ids)
+    return not old_ids
+
+
+def blue_green_instances(asg, module):
+    ''' The instances of asg, in group order, that a blue/green swap
+        replaces: those replace() would terminate over all its batches. '''
+    index = get_instance_index(asg)
+    replace_instances = module.params.get('replace_instances')
+    replace_ids = set(replace_instances) if replace_instances else index.ids
+    return index.ordered(index.purgeable(module.params.get('lc_check'), replace_ids, replace_ids))
+
+
+def blue_green(asg_connection, elb_connection, elb2_connection, module):
+    ''' Replaces the instances of the group all at once. A temporary green
+        group, a clone of the group on the new launch config, launches one
+        instance for every old one. The green group has no load balancers or
+        target groups, so that detaching from it deregisters nothing. Once
+        its instances are viable they are detached from it and attached to
+        the group, a few at a time, while the old instances keep serving.
+        When they are healthy behind the group's load balancers the old
+        instances are drained and terminated, the sizes restored and the
+        green group deleted. '''
+    wait_timeout = module.params.get('wait_timeout')
+    group_name = module.params.get('name')
+    green_name = group_name + '-green'
+    progress = get_progress(module)
+    started = time.time()
+
+    if (get_asg_by_name(asg_connection, green_name)):
+        module.fail_json(msg="Group {0} of an unfinished blue/green replacement of {1} exists, delete it "
+                             "first.".format(green_name, group_name))
+    asg = get_asg_by_name(asg_connection, group_name)
+    if (replace_converged(asg, module)):
+        log.debug("No instance of {0} needs replacing.".format(group_name))
+        progress.emit('converged')
+        changed = False
+        return (changed, asg)
+    # the update part of this run has already set the group to launch from the new config or template
+    launch_key = get_launch_key(asg)
+    min_size = asg['MinSize']
+    max_size = asg['MaxSize']
+    desired_capacity = asg['DesiredCapacity']
+    old_instances = blue_green_instances(asg, module)
+    index = get_instance_index(asg)
+    # capacity, not instances: weighted replacements may need fewer of them
+    size = index.capacity(instance_ids(old_instances))
+    current = index.capacity(index.viable(launch_key))
+    progress.emit('replace_start', mode='blue_green', instances=size, desired_capacity=desired_capacity)
+
+    green = dict((key, asg[key]) for key in ASG_UPDATABLE_ATTRIBUTES if asg.get(key) not in (None, ''))
+    if (green.get('VPCZoneIdentifier')):
+        green.pop('AvailabilityZones', None)
+    green.pop('LaunchConfigurationName', None)
+    green.update(group_launch_args(asg))
+    green.update(AutoScalingGroupName=green_name, MinSize=size, MaxSize=size, DesiredCapacity=size,
+                 Tags=[dict(tag, ResourceId=green_name) for tag in asg['Tags']])
+    # detach_instances would deregister the green instances from load
+    # balancers shared with the group, they are only checked behind them once
+    # attached to it
+    green['HealthCheckType'] = 'EC2'
+    try:
+        asg_connection.create_auto_scaling_group(**green)
+    except botocore.exceptions.ClientError as e:
+        module.fail_json(msg="Failed to create green group {0}: {1}".format(green_name, str(e)),
+                         exception=traceback.format_exc())
+    wait_for_new_inst(module, asg_connection, green_name, wait_timeout, size)
+
+    # move the green fleet over without the green group replacing what leaves it
+    green = get_asg_by_name(asg_connection, green_name)
+    green_index = get_instance_index(green)
+    green_ids = [instance['InstanceId'] for instance in
+                 green_index.up_to(green_index.ordered(green_index.viable(launch_key)), size)]
+    moved = green_index.capacity(green_ids)
+    update_size(asg_connection, green, size, 0, size)
+    update_size(asg_connection, asg, max_size + moved, min_size, desired_capacity)
+    waiter = get_waiter(module)
+    for ids in get_chunks(green_ids, API_BATCH_LIMITS['instances']):
+        asg_connection.detach_instances(InstanceIds=ids, AutoScalingGroupName=green_name,
+                                        ShouldDecrementDesiredCapacity=True)
+
+        def detached():
+            return not asg_connection.describe_auto_scaling_instances(InstanceIds=ids)['AutoScalingInstances']
+
+        if (not waiter.wait(detached, asg_connection, green_name, wait_timeout)):
+            module.fail_json(msg="Waited too long for instances to leave {0}. {1}".format(green_name, time.asctime()))
+        asg_connection.attach_instances(InstanceIds=ids, AutoScalingGroupName=group_name)
+    wait_for_elb(asg_connection, elb_connection, elb2_connection, module, group_name, launch_key,
+                 current + moved)
+
+    old_ids = [instance['InstanceId'] for instance in old_instances]
+    elb_dreg(asg_connection, elb_connection, elb2_connection, module, group_name, old_ids)
+    for instance_id in old_ids:
+        asg_connection.terminate_instance_in_auto_scaling_group(InstanceId=instance_id,
+                                                                ShouldDecrementDesiredCapacity=True)
+    progress.emit('instances_terminated', instances=old_ids, decrement_capacity=True)
+    wait_for_term_inst(asg_connection, module, old_instances)
+    asg = get_asg_by_name(asg_connection, group_name)
+    update_size(asg_connection, asg, max_size, min_size, desired_capacity)
+
+    asg_connection.delete_auto_scaling_group(AutoScalingGroupName=green_name, ForceDelete=True)
+    if (not waiter.wait(lambda: not get_asg_by_name(asg_connection, green_name), asg_connection, green_name,
+                        wait_timeout)):
+        module.fail_json(msg="Waited too long for {0} to be deleted. {1}".format(green_name, time.asctime()))
+    progress.emit('replace_end', mode='blue_green', seconds=round(time.time() - started, 1))
+    asg = get_asg_by_name(asg_connection, group_name)
+    log.debug("Blue/green replacement complete.")
+    changed = True
+    return (changed, asg)
+
+
+class SnapshotInstances(list):
+    ''' The Instances of a snapshot cached by AsgSnapshotCache, carrying the
+        InstanceIndex built from them. '''
+    instance_index = None
+
+
+def get_instance_index(asg):
+    ''' The InstanceIndex of asg, built once per cached snapshot. '''
+    instances = asg['Instances']
+    if (not isinstance(instances, SnapshotInstances)):
+        return InstanceIndex(asg)
+    index = instances.instance_index
+    if (index is None or index.launch_key != get_launch_key(asg)):
+        index = instances.instance_index = InstanceIndex(asg)
+    return index
+
+
+def get_launch_key(item):
+    ''' What an instance was launched from, or what a group launches from,
+        as one comparable string: the launch configuration name, or
+        'template:<id>:<version>' for a launch template given on its own or
+        in a MixedInstancesPolicy. '''
+    if (item.get('LaunchConfigurationName')):
+        return item['LaunchConfigurationName']
+    template = item.get('LaunchTemplate')
+    if (not template and item.get('MixedInstancesPolicy')):
+        template = item['MixedInstancesPolicy']['LaunchTemplate']['LaunchTemplateSpecification']
+    if (not template):
+        return None
+    return 'template:{0}:{1}'.format(template.get('LaunchTemplateId') or template.get('LaunchTemplateName'),
+                                     template.get('Version'))
+
+
+class InstanceIndex(object):
+    ''' InstanceId keyed view of the instances in one describe of a group.
+        Only the INSTANCE_ATTRIBUTES of each instance are kept, and every
+        classification is a set operation against the index instead of a
+        scan of the instance list per instance asked about. An index can also
+        follow a group it models through add() and discard(). '''
+
+    def __init__(self, asg):
+        self.order = []
+        self.records = {}
+        self.ids = set()
+        self.current = set()
+        self.viable_ids = {}
+        # instances with a WeightedCapacity other than one
+        self.weighted = 0
+        self.launch_key = get_launch_key(asg)
+        for instance in asg['Instances']:
+            self.add(instance)
+
+    def add(self, instance):
+        record = InstanceRecord(instance['InstanceId'], instance['HealthStatus'], instance['LifecycleState'],
+                                get_launch_key(instance), instance.get('AvailabilityZone'),
+                                int(instance.get('WeightedCapacity') or 1))
+        self.order.append(record.instance_id)
+        self.records[record.instance_id] = record
+        self.ids.add(record.instance_id)
+        if (record.weight != 1):
+            self.weighted += 1
+        if (record.launch_key is not None and record.launch_key == self.launch_key):
+            self.current.add(record.instance_id)
+        for launch_key, viable in self.viable_ids.items():
+            if (self.is_viable(record, launch_key)):
+                viable.add(record.instance_id)
+
+    def discard(self, instance_id):
+        record = self.records.pop(instance_id, None)
+        if (record is None):
+            return
+        if (record.weight != 1):
+            self.weighted -= 1
+        self.order.remove(instance_id)
+        self.ids.discard(instance_id)
+        self.current.discard(instance_id)
+        for viable in self.viable_ids.values():
+            viable.discard(instance_id)
+
+    def copy(self):
+        ''' An index of the same instances that add() and discard() on this
+            one leave alone. '''
+        index = copy.copy(self)
+        index.order = list(self.order)
+        index.records = dict(self.records)
+        index.ids = set(self.ids)
+        index.current = set(self.current)
+        index.viable_ids = dict((launch_key, set(viable)) for launch_key, viable in self.viable_ids.items())
+        return index
+
+    def ordered(self, ids):
+        return [{'InstanceId': instance_id} for instance_id in self.order if instance_id in ids]
+
+    def split(self, lc_check, initial_ids):
+        ''' Returns the (new, old) instance ids: old are those without the
+            group's launch config, or the initial ones when lc_check is off. '''
+        if (lc_check):
+            return self.current, self.ids - self.current
+        old_ids = self.ids & initial_ids
+        return self.ids - old_ids, old_ids
+
+    def purgeable(self, lc_check, replace_ids, initial_ids):
+        # instances already terminating are on their way out
+        present = set(instance_id for instance_id in self.ids & replace_ids
+                      if (not self.records[instance_id].lifecycle_state.startswith('Terminating')))
+        if (lc_check):
+            return present - self.current
+        return present & initial_ids
+
+    def terminating(self, ids):
+        return set(instance_id for instance_id in self.ids & ids
+                   if (self.records[instance_id].lifecycle_state.startswith('Terminating') or
+                       self.records[instance_id].health_status == 'Unhealthy'))
+
+    def az_balanced(self, ids):
+        ''' Orders ids round-robin over their availability zones, always
+            taking the next one from the zone where the group has the most
+            instances left, so that any run cut from the front of the order
+            leaves the zones as even as they can be and gives AZRebalance
+            nothing to do. Ties go to the zones in name order. '''
+        left = {}
+        for record in self.records.values():
+            if (not record.lifecycle_state.startswith('Terminating')):
+                left[record.availability_zone] = left.get(record.availability_zone, 0) + 1
+        zones = {}
+        for instance_id in self.order:
+            if (instance_id in ids):
+                zones.setdefault(self.records[instance_id].availability_zone, []).append(instance_id)
+        ordered = []
+        while (zones):
+            zone = max(sorted(zones, key=str), key=lambda name: left.get(name, 0))
+            ordered.append(zones[zone].pop(0))
+            left[zone] = left.get(zone, 0) - 1
+            if (not zones[zone]):
+                del zones[zone]
+        return ordered
+
+    def is_viable(self, record, launch_key=None):
+        return (record.lifecycle_state == 'InService' and record.health_status == 'Healthy' and
+                (not launch_key or record.launch_key == launch_key))
+
+    def viable(self, launch_key=None):
+        viable = self.viable_ids.get(launch_key)
+        if (viable is None):
+            viable = self.viable_ids[launch_key] = set(
+                record.instance_id for record in self.records.values() if (self.is_viable(record, launch_key)))
+        return viable
+
+    def capacity(self, ids):
+        ''' The capacity the instances among ids count for, in the units of
+            the group's desired capacity: their WeightedCapacity, or one
+            each. '''
+        if (not self.weighted):
+            return len(self.ids.intersection(ids))
+        return sum(self.records[instance_id].weight for instance_id in ids if instance_id in self.records)
+
+    def up_to(self, instances, capacity):
+        ''' The first of instances, as many as it takes to reach capacity. '''
+        taken = []
+        total = 0
+        for instance in instances:
+            if (total >= capacity):
+                break
+            taken.append(instance)
+            total += self.capacity([instance['InstanceId']])
+        return taken
+
+
+def instance_ids(instances):
+    return set(instance['InstanceId'] for instance in instances)
+
+
+def az_balanced_instances(asg, lc_check, instances):
+    ''' Orders instances for the batches of replace(): first those it will
+        terminate, spread over the availability zones by
+        InstanceIndex.az_balanced, then the others in their own order. '''
+    index = get_instance_index(asg)
+    initial_ids = instance_ids(instances)
+    old_ids = index.purgeable(lc_check, initial_ids, initial_ids)
+    return ([{'InstanceId': instance_id} for instance_id in index.az_balanced(old_ids)] +
+            [instance for instance in instances if instance['InstanceId'] not in old_ids])
+
+
+def get_instances_by_lc(asg, lc_check, initial_instances, index=None):
+    if (index is None):
+        index = get_instance_index(asg)
+    if (not lc_check):
         log.debug("Comparing initial instances with current: {0}".format(initial_instances))
-        for i in asg['Instances']:
-            if (i not in initial_instances):
-                new_instances.append(i)
-            else:
-                old_instances.append(i)
+    new_ids, old_ids = index.split(lc_check, instance_ids(initial_instances))
+    new_instances = index.ordered(new_ids)
+    old_instances = index.ordered(old_ids)
     log.debug("New instances: {0}, {1}".format(len(new_instances), new_instances))
     log.debug("Old instances: {0}, {1}".format(len(old_instances), old_instances))
 
     return new_instances, old_instances
 
 
-def list_purgeable_instances(asg, lc_check, replace_instances, initial_instances):
-    instances_to_terminate = []
-    instances = []
-    for instance in replace_instances:
-        for asg_instance in asg['Instances']:
-            if (instance['InstanceId'] == asg_instance['InstanceId']):
-                instances.append(instance)
-                break
-
+def list_purgeable_instances(asg, lc_check, replace_instances, initial_instances, index=None):
     # check to make sure instances given are actually in the given ASG
     # and they have a non-current launch config
-    if (lc_check):
-        for i in instances:
-            if ((not ('LaunchConfigurationName' in i)) or (i['LaunchConfigurationName'] != asg['LaunchConfigurationName'])):
-                instances_to_terminate.append(i)
-    else:
-        for i in instances:
-            if (i in initial_instances):
-                instances_to_terminate.append(i)
-    return instances_to_terminate
-
-
-def terminate_batch(asg_connection, elb_connection, elb2_connection, module, min_size, desired_capacity,
-                    replace_instances, initial_instances, leftovers=False):
-    batch_size = module.params.get('replace_batch_size')
+    if (index is None):
+        index = get_instance_index(asg)
+    purgeable = index.purgeable(lc_check, instance_ids(replace_instances), instance_ids(initial_instances))
+    return [instance for instance in replace_instances if instance['InstanceId'] in purgeable]
+
+
+def batch_terminations(asg_connection, module, min_size, desired_capacity, replace_instances, initial_instances,
+                       leftovers=False, batch_size=None, prelaunched=0):
+    ''' Picks the instances of a batch to terminate. Returns (break_loop,
+        desired_size, instances_to_terminate, decrements), where decrements
+        maps the instances whose termination decrements the desired capacity
+        to the capacity they count for. prelaunched is the capacity raised
+        ahead of this batch by a pipelined replace(); terminations up to that
+        much give their capacity back instead of launching another
+        replacement. '''
+    if (batch_size is None):
+        batch_size = module.params.get('replace_batch_size')
     group_name = module.params.get('name')
     lc_check = module.params.get('lc_check')
     decrement_capacity = False
@@ -848,14 +2811,14 @@ def terminate_batch(asg_connection, elb_connection, elb2_connection, module, min
     asg = get_asg_by_name(asg_connection, group_name)
     desired_size = asg['MinSize']
 
-    new_instances, old_instances = get_instances_by_lc(asg, lc_check, initial_instances)
-    num_new_inst_needed = desired_capacity - len(new_instances)
+    index = get_instance_index(asg)
+    new_instances, old_instances = get_instances_by_lc(asg, lc_check, initial_instances, index)
+    num_new_inst_needed = desired_capacity - index.capacity(instance_ids(new_instances))
 
-    # check to make sure instances given are actually in the given ASG
-    # and they have a non-current launch config
-    instances_to_terminate = list_purgeable_instances(asg, lc_check, replace_instances, initial_instances)
+    instances_to_terminate = list_purgeable_instances(asg, lc_check, replace_instances, initial_instances, index)
 
-    if (num_new_inst_needed == 0):
+    # an adaptive batch that raised the extra capacity can leave more new instances than needed
+    if (num_new_inst_needed <= 0):
         decrement_capacity = True
         if (asg['MinSize'] != min_size):
             asg['MinSize'] = min_size
@@ -870,22 +2833,50 @@ def terminate_batch(asg_connection, elb_connection, elb2_connection, module, min
         if (leftovers):
             decrement_capacity = False
         break_loop = True
-        instances_to_terminate = old_instances
+        instances_to_terminate = list_purgeable_instances(asg, lc_check, old_instances, initial_instances, index)
         desired_size = min_size
         log.debug("No new instances needed")
     elif (num_new_inst_needed < batch_size):
-        instances_to_terminate = instances_to_terminate[:num_new_inst_needed]
+        instances_to_terminate = index.up_to(instances_to_terminate, num_new_inst_needed)
         decrement_capacity = False
         break_loop = False
         log.debug("{0} new instances needed".format(num_new_inst_needed))
 
     log.debug("decrementing capacity: {0}".format(decrement_capacity))
 
+    decrements = {}
     for instance in instances_to_terminate:
-        elb_dreg(asg_connection, elb_connection, elb2_connection, module, group_name, instance['InstanceId'])
+        if (decrement_capacity or prelaunched > 0):
+            decrements[instance['InstanceId']] = index.capacity([instance['InstanceId']])
+        prelaunched -= index.capacity([instance['InstanceId']])
+
+    return break_loop, desired_size, instances_to_terminate, decrements
+
+
+def terminate_instances(asg_connection, elb_connection, elb2_connection, module, instances, decrements):
+    ''' Deregisters instances from the group's load balancers and terminates
+        them, decrementing the desired capacity for those in decrements. '''
+    # deregister the whole batch at once and let it drain together before terminating any of it
+    elb_dreg(asg_connection, elb_connection, elb2_connection, module, module.params.get('name'),
+             [instance['InstanceId'] for instance in instances])
+    for instance in instances:
         log.debug("terminating instance: {0}".format(instance['InstanceId']))
-        asg_connection.terminate_instance_in_auto_scaling_group(InstanceId=instance['InstanceId'],
-                                                                ShouldDecrementDesiredCapacity=decrement_capacity)
+        asg_connection.terminate_instance_in_auto_scaling_group(
+            InstanceId=instance['InstanceId'], ShouldDecrementDesiredCapacity=instance['InstanceId'] in decrements)
+    # a pipelined batch decrements only as far as the capacity raised ahead of it
+    for decrement in (True, False):
+        terminated = [instance['InstanceId'] for instance in instances
+                      if (instance['InstanceId'] in decrements) == decrement]
+        if (terminated):
+            get_progress(module).emit('instances_terminated', instances=terminated, decrement_capacity=decrement)
+
+
+def terminate_batch(asg_connection, elb_connection, elb2_connection, module, min_size, desired_capacity,
+                    replace_instances, initial_instances, leftovers=False, batch_size=None, prelaunched=0):
+    break_loop, desired_size, instances_to_terminate, decrements = batch_terminations(
+        asg_connection, module, min_size, desired_capacity, replace_instances, initial_instances, leftovers,
+        batch_size, prelaunched)
+    terminate_instances(asg_connection, elb_connection, elb2_connection, module, instances_to_terminate, decrements)
 
     # we wait to make sure the machines we marked as Unhealthy are
     # no longer in the list
@@ -894,80 +2885,540 @@ def terminate_batch(asg_connection, elb_connection, elb2_connection, module, min
 
 
 def wait_for_term_inst(asg_connection, module, term_instances):
-    wait_timeout = module.params.get('wait_timeout')
-    group_name = module.params.get('name')
-    count = 1
-    wait_timeout = time.time() + wait_timeout
-    while (wait_timeout > time.time() and count > 0):
-        log.debug("waiting for instances to terminate")
-        count = 0
-        asg = get_asg_by_name(asg_connection, group_name)
-        instances = []
-        for asg_instance in asg['Instances']:
-            for term_instance in term_instances:
-                if (asg_instance['InstanceId'] == term_instance['InstanceId']):
-                    instances.append(asg_instance)
-                    break
+    with get_metrics(asg_connection).phase('wait_for_term_inst'):
+        wait_timeout = module.params.get('wait_timeout')
+        group_name = module.params.get('name')
+        term_ids = instance_ids(term_instances)
+        progress = get_progress(module)
+        deadline = progress.deadline(wait_timeout)
+        pending = set()
+
+        def terminated():
+            log.debug("waiting for instances to terminate")
+            index = get_instance_index(get_asg_by_name(asg_connection, group_name))
+            terminating = index.terminating(term_ids)
+            log.debug("Instances still terminating: {0}".format(sorted(terminating)))
+            progress.emit('terminating', deadline, instances=sorted(terminating))
+            pending.clear()
+            pending.update(terminating)
+            return not terminating
+
+        if (not get_waiter(module).wait(terminated, asg_connection, group_name, wait_timeout,
+                                        events=notified_terminations(pending))):
+            # waiting took too long
+            module.fail_json(msg="Waited too long for old instances to terminate. %s" % time.asctime())
 
-        for i in instances:
-            lifecycle = i['LifecycleState']
-            health = i['HealthStatus']
-            log.debug("Instance {0} has state of {1},{2}".format(i['InstanceId'], lifecycle, health))
-            if (lifecycle == 'Terminating' or health == 'Unhealthy'):
-                count += 1
-        time.sleep(10)
 
-    if (wait_timeout <= time.time()):
-        # waiting took too long
-        module.fail_json(msg="Waited too long for old instances to terminate. %s" % time.asctime())
+def wait_for_new_inst(module, asg_connection, group_name, wait_timeout, desired_size):
+    with get_metrics(asg_connection).phase('wait_for_new_inst'):
+        progress = get_progress(module)
+        deadline = progress.deadline(wait_timeout)
+        # the fewest launches that could make up the capacity still missing
+        launches = [0]
+
+        # make sure we have the latest stats after that last loop.
+        def viable():
+            asg = get_asg_by_name(asg_connection, group_name)
+            index = get_instance_index(asg)
+            viable_instances = index.capacity(index.viable())
+            log.debug("Waiting for viable_instances = {0}, currently {1}".format(desired_size, viable_instances))
+            progress.emit('viable', deadline, viable=viable_instances, wanted=desired_size)
+            if (viable_instances >= desired_size):
+                return asg
+            overrides = asg.get('MixedInstancesPolicy', {}).get('LaunchTemplate', {}).get('Overrides', [])
+            weight = max([int(override.get('WeightedCapacity') or 1) for override in overrides] or [1])
+            launches[0] = -(-(desired_size - viable_instances) // weight)
+            return None
+
+        def launched(received):
+            return len([event for event in received
+                        if event['Event'] == 'autoscaling:EC2_INSTANCE_LAUNCH']) >= launches[0]
+
+        # now we make sure that we have enough instances in a viable state
+        asg = get_waiter(module).wait(viable, asg_connection, group_name, wait_timeout, events=launched)
+        if (asg is None):
+            # waiting took too long
+            module.fail_json(msg="Waited too long for new instances to become viable. %s" % time.asctime())
+        log.debug("Reached viable_instances: {0}".format(desired_size))
+        return asg
+
+
+class GroupFailure(Exception):
+    pass
+
+
+class GroupModule(object):
+    ''' Stands in for the AnsibleModule while one entry of groups is being
+        managed. params are the module params overlaid with the entry, and
+        fail_json raises GroupFailure so that a failing group is reported on
+        its own instead of ending the run for every other group. '''
+
+    def __init__(self, module, params):
+        self.module = module
+        self.params = params
+        self.check_mode = module.check_mode
+
+    def fail_json(self, **kwargs):
+        raise GroupFailure(kwargs)
+
+
+def convert_option(module, option_type, value):
+    ''' Converts value to option_type the way AnsibleModule does, for module
+        stand-ins that have no type checks of their own. '''
+    if (option_type == 'int'):
+        return int(value)
+    if (option_type == 'float'):
+        return float(value)
+    if (option_type == 'bool'):
+        return module.boolean(value)
+    if (option_type == 'list'):
+        if (isinstance(value, list)):
+            return value
+        if (isinstance(value, string_types)):
+            return value.split(',')
+        if (isinstance(value, (int, float))):
+            return [str(value)]
+        raise TypeError("%s cannot be converted to a list" % type(value))
+    if (option_type == 'dict'):
+        if (isinstance(value, dict)):
+            return value
+        if (isinstance(value, string_types) and value.startswith('{')):
+            return json.loads(value)
+        raise TypeError("%s cannot be converted to a dict" % type(value))
+    if (option_type == 'path'):
+        return os.path.expanduser(os.path.expandvars(str(value)))
+    if (option_type == 'str' and not isinstance(value, string_types)):
+        return str(value)
+    return value
+
+
+def group_params(module, spec):
+    ''' Overlays one entry of groups on the module params, converting and
+        checking its values against the argument spec with the type checks
+        and choices AnsibleModule applies to the top level options. '''
+    params = dict(module.params)
+    del params['groups']
+    if (isinstance(spec, string_types)):
+        spec = {'name': spec}
+    if (not isinstance(spec, dict) or not spec.get('name')):
+        module.fail_json(msg="Every entry of groups needs at least a name: %s" % str(spec))
+    # the type checks AnsibleModule itself applies, where the module is one
+    checkers = getattr(module, '_CHECK_ARGUMENT_TYPES_DISPATCHER', {})
+    for key, value in spec.items():
+        option = module.argument_spec.get(key)
+        if (option is None or key in ('groups', 'group_concurrency', 'state')):
+            module.fail_json(msg="Unsupported option {0} for group {1}".format(key, spec['name']))
+        option_type = option.get('type', 'str')
+        if (value is not None):
+            try:
+                if (option_type in checkers):
+                    value = checkers[option_type](value)
+                else:
+                    value = convert_option(module, option_type, value)
+            except (TypeError, ValueError) as e:
+                module.fail_json(msg="Option {0} for group {1} is not a valid {2}: {3}".format(
+                    key, spec['name'], option_type, str(e)))
+            choices = option.get('choices')
+            if (choices and any(item not in choices for item in (value if isinstance(value, list) else [value]))):
+                module.fail_json(msg="Option {0} for group {1} must be one of: {2}, got {3}".format(
+                    key, spec['name'], ", ".join(str(choice) for choice in choices), value))
+        params[key] = value
+    if (params.get('replace_all_instances') and params.get('replace_instances')):
+        module.fail_json(msg="parameters are mutually exclusive: replace_all_instances, replace_instances "
+                             "(group {0})".format(spec['name']))
+    return params
+
+
+def manage_group(asg_connection, ec2_connection, elb_connection, elb2_connection, module):
+    ''' Brings one group to the requested state and returns (changed, asg_properties).
+        Once the group has been deleted asg_properties only holds the time it
+        took, and it is None when there was no group to delete. '''
+    state = module.params.get('state')
+    replace_instances = module.params.get('replace_instances')
+    replace_all_instances = module.params.get('replace_all_instances')
+    changed = create_changed = replace_changed = False
 
+    if (module.check_mode):
+        return plan_group(asg_connection, module)
+    if (state == 'absent'):
+        return delete_autoscaling_group(asg_connection, module)
+    create_changed, asg_properties = create_autoscaling_group(asg_connection, ec2_connection, elb_connection,
+                                                              elb2_connection, module)
+    if (replace_all_instances or replace_instances):
+        changes = asg_properties.get('changes')
+        if (module.params.get('replace_mode') == 'blue_green'):
+            replace_changed, asg_properties = blue_green(asg_connection, elb_connection, elb2_connection, module)
+        else:
+            replace_changed, asg_properties = replace(asg_connection, elb_connection, elb2_connection, module)
+        if (changes is not None):
+            asg_properties['changes'] = changes
+    if (create_changed or replace_changed):
+        changed = True
+    return (changed, asg_properties)
 
-def wait_for_new_inst(module, asg_connection, group_name, wait_timeout, desired_size):
-    # make sure we have the latest stats after that last loop.
-    asg = get_asg_by_name(asg_connection, group_name)
 
-    viable_instances = 0
-    for instance in asg['Instances']:
-        if (instance['HealthStatus'] == 'Healthy' and instance['LifecycleState'] == 'InService'):
-            viable_instances += 1
-    log.debug("Waiting for viable_instances = {0}, currently {1}".format(desired_size, viable_instances))
-
-    # now we make sure that we have enough instances in a viable state
-    wait_timeout = time.time() + wait_timeout
-    while (wait_timeout > time.time() and desired_size > viable_instances):
-        log.debug("Waiting for viable_instances = {0}, currently {1}".format(desired_size, viable_instances))
-        time.sleep(10)
-        asg = get_asg_by_name(asg_connection, group_name)
-        viable_instances = 0
+def manage_groups(asg_connection, ec2_connection, elb_connection, elb2_connection, module):
+    ''' Manages every entry of groups concurrently, at most group_concurrency
+        at a time, over the same connections. Returns (changed, results) where
+        results holds one entry per group, failed ones included. '''
+    group_modules = [GroupModule(module, group_params(module, spec)) for spec in module.params.get('groups')]
+    # one paginated describe for every group instead of one per group
+    fleet = FleetReader(asg_connection)
+    fleet.read(group_module.params['name'] for group_module in group_modules)
+    fleet.prime(asg_connection)
+
+    def run(group_module):
+        group_name = group_module.params['name']
+        try:
+            changed, asg_properties = manage_group(asg_connection, ec2_connection, elb_connection, elb2_connection,
+                                                   group_module)
+        except GroupFailure as e:
+            return dict(e.args[0], name=group_name, changed=False, failed=True)
+        except Exception as e:
+            return dict(name=group_name, changed=False, failed=True, msg=str(e), exception=traceback.format_exc())
+        result = dict(asg_properties or {})
+        result.update(name=group_name, changed=changed, failed=False)
+        return result
+
+    results = {}
+    for group_module, result in run_concurrently(run, group_modules, module.params.get('group_concurrency')):
+        results[id(group_module)] = result
+    results = [results[id(group_module)] for group_module in group_modules]
+    changed = any(result['changed'] for result in results)
+    return (changed, results)
+
+
+class PlanModel(object):
+    ''' In-memory stand-in for the autoscaling, elb and elbv2 clients that
+        replace() runs against to plan a rolling update in check mode. It
+        starts from one snapshot of the group. Launched instances are
+        InService and healthy at once, terminations and deregistrations
+        complete immediately, and every call is counted instead of being
+        made. Consecutive terminations are recorded as one batch. The group's
+        capacity and InstanceIndex are kept up to date as instances come and
+        go instead of being worked out again. Every describe still hands out
+        its own copy of the instances and the index, since replace() keeps
+        using a snapshot after it has terminated some of its instances. '''
+
+    def __init__(self, asg):
+        self.group = dict(asg)
+        self.instances = OrderedDict()
+        self.total_capacity = 0
+        self.index = None
         for instance in asg['Instances']:
-            if (instance['HealthStatus'] == 'Healthy' and instance['LifecycleState'] == 'InService'):
-                viable_instances += 1
+            self.add(dict(instance))
+        self.deregistered = set()
+        self.launched = 0
+        self.peak_capacity = asg['DesiredCapacity']
+        self.batches = []
+        self.calls = {}
+        self.last_operation = None
+
+    def record(self, service, operation):
+        key = '{0}.{1}'.format(service, operation)
+        self.calls[key] = self.calls.get(key, 0) + 1
+        self.last_operation = operation
+
+    def capacity(self, instances):
+        return sum(int(instance.get('WeightedCapacity') or 1) for instance in instances)
+
+    def add(self, instance):
+        self.instances[instance['InstanceId']] = instance
+        self.total_capacity += self.capacity([instance])
+        if (self.index is not None):
+            self.index.add(instance)
+
+    def remove(self, instance_id):
+        instance = self.instances.pop(instance_id)
+        self.total_capacity -= self.capacity([instance])
+        if (self.index is not None):
+            self.index.discard(instance_id)
+        return instance
+
+    def launched_instance(self):
+        ''' An instance as the group would launch it now. With a
+            MixedInstancesPolicy it is of the first instance type. '''
+        self.launched += 1
+        instance = {
+            'InstanceId': 'planned-{0}'.format(self.launched),
+            'LifecycleState': 'InService',
+            'HealthStatus': 'Healthy'
+        }
+        for key in LAUNCH_SPEC_ATTRIBUTES[:2]:
+            if (self.group.get(key)):
+                instance[key] = self.group[key]
+        policy = self.group.get('MixedInstancesPolicy')
+        if (policy):
+            instance['LaunchTemplate'] = policy['LaunchTemplate']['LaunchTemplateSpecification']
+            overrides = policy['LaunchTemplate'].get('Overrides')
+            if (overrides):
+                instance['InstanceType'] = overrides[0]['InstanceType']
+                if (overrides[0].get('WeightedCapacity')):
+                    instance['WeightedCapacity'] = overrides[0]['WeightedCapacity']
+        return instance
+
+    def settle(self):
+        ''' Launches or terminates instances until the group is at its desired
+            capacity, terminating instances of other launch configs or
+            templates first. '''
+        while (self.total_capacity < self.group['DesiredCapacity']):
+            self.add(self.launched_instance())
+        if (self.total_capacity > self.group['DesiredCapacity']):
+            current = get_launch_key(self.group)
+            instances = sorted(self.instances.values(), key=lambda instance: get_launch_key(instance) == current)
+            self.instances = OrderedDict((instance['InstanceId'], instance) for instance in instances)
+            self.index = None
+            for instance in instances:
+                if (self.total_capacity - self.capacity([instance]) < self.group['DesiredCapacity']):
+                    break
+                self.remove(instance['InstanceId'])
+        self.peak_capacity = max(self.peak_capacity, self.group['DesiredCapacity'])
+
+    def describe_auto_scaling_groups(self, AutoScalingGroupNames=None, MaxRecords=None, NextToken=None):
+        self.record('autoscaling', 'describe_auto_scaling_groups')
+        group = dict(self.group)
+        group['Instances'] = SnapshotInstances(self.instances.values())
+        if (self.index is None or self.index.launch_key != get_launch_key(group)):
+            self.index = InstanceIndex(group)
+            # replace() asks every snapshot for these, let add() and discard() keep them
+            self.index.viable()
+            self.index.viable(self.index.launch_key)
+        group['Instances'].instance_index = self.index.copy()
+        return {'AutoScalingGroups': [group]}
+
+    def update_auto_scaling_group(self, **kwargs):
+        self.record('autoscaling', 'update_auto_scaling_group')
+        if (any(key in kwargs for key in LAUNCH_SPEC_ATTRIBUTES)):
+            for key in LAUNCH_SPEC_ATTRIBUTES:
+                self.group.pop(key, None)
+        self.group.update(kwargs)
+        self.settle()
+
+    def terminate_instance_in_auto_scaling_group(self, InstanceId, ShouldDecrementDesiredCapacity):
+        if (self.last_operation != 'terminate_instance_in_auto_scaling_group'):
+            self.batches.append({'batch': len(self.batches) + 1, 'terminate': []})
+        self.record('autoscaling', 'terminate_instance_in_auto_scaling_group')
+        terminated = [self.remove(InstanceId)] if InstanceId in self.instances else []
+        if (ShouldDecrementDesiredCapacity):
+            self.group['DesiredCapacity'] -= self.capacity(terminated)
+        self.settle()
+        self.batches[-1]['terminate'].append(InstanceId)
+        self.batches[-1]['desired_capacity'] = self.group['DesiredCapacity']
+
+    def describe_warm_pool(self, AutoScalingGroupName, MaxRecords=None, NextToken=None):
+        self.record('autoscaling', 'describe_warm_pool')
+        return {'WarmPoolConfiguration': self.group.get('WarmPoolConfiguration'), 'Instances': []}
+
+    def put_warm_pool(self, AutoScalingGroupName, **kwargs):
+        self.record('autoscaling', 'put_warm_pool')
+        self.group['WarmPoolConfiguration'] = kwargs
+
+    def describe_load_balancers(self, LoadBalancerNames):
+        self.record('elb', 'describe_load_balancers')
+        return {'LoadBalancerDescriptions': [
+            {'LoadBalancerName': name, 'Instances': [{'InstanceId': instance['InstanceId']}
+                                                     for instance in self.instances.values()]}
+            for name in LoadBalancerNames]}
+
+    def deregister_instances_from_load_balancer(self, LoadBalancerName, Instances):
+        self.record('elb', 'deregister_instances_from_load_balancer')
+        self.deregistered.update(instance['InstanceId'] for instance in Instances)
+
+    def describe_instance_health(self, LoadBalancerName, Instances):
+        self.record('elb', 'describe_instance_health')
+        return {'InstanceStates': [{'InstanceId': instance['InstanceId'],
+                                    'State': 'OutOfService' if instance['InstanceId'] in self.deregistered
+                                    else 'InService'} for instance in Instances]}
+
+    def describe_target_groups(self, TargetGroupArns):
+        self.record('elbv2', 'describe_target_groups')
+        return {'TargetGroups': [{'TargetGroupArn': arn} for arn in TargetGroupArns]}
+
+    def deregister_targets(self, TargetGroupArn, Targets):
+        self.record('elbv2', 'deregister_targets')
+        self.deregistered.update(target['Id'] for target in Targets)
+
+    def describe_target_health(self, TargetGroupArn, Targets):
+        self.record('elbv2', 'describe_target_health')
+        return {'TargetHealthDescriptions': [
+            {'Target': {'Id': target['Id']},
+             'TargetHealth': {'State': 'draining' if target['Id'] in self.deregistered else 'healthy'}}
+            for target in Targets]}
+
+
+class PlanWaiter(Waiter):
+    ''' Checks a condition once and never sleeps: against a PlanModel every
+        wait of replace() already holds. '''
+
+    def wait(self, condition, asg_connection=None, group_name=None, timeout=None, events=False):
+        return condition() or None
+
+
+def plan_group(asg_connection, module):
+    ''' Works out in check mode what managing the group would do, from a
+        single describe and without any write or sleep. A rolling replacement
+        is planned by running replace() against a PlanModel of the group as
+        the update would leave it. It reports the batch schedule, peak
+        capacity, the instances it would terminate, a lower bound on the API
+        calls made and an estimated duration. The estimate assumes every
+        wait for new instances takes plan_batch_seconds. '''
+    group_name = module.params.get('name')
+    asg = get_asg_by_name(asg_connection, group_name)
+    if (module.params.get('state') == 'absent'):
+        return (asg is not None, {'plan': {'delete': asg is not None}})
+    if (asg is None):
+        return (True, {'plan': {'create': True}})
+
+    changes = group_diff(asg_connection, module, asg)
+    plan = {'create': False, 'changes': changes}
+    changed = bool(changes)
+    batch_seconds = module.params.get('plan_batch_seconds')
+    if (batch_seconds is None):
+        batch_seconds = asg['HealthCheckGracePeriod']
+    replacing = module.params.get('replace_all_instances') or module.params.get('replace_instances')
+    model_asg = dict(asg)
+    for key, value in changes.get('attributes', {}).items():
+        if (key in LAUNCH_SPEC_ATTRIBUTES):
+            # a group launches from only one of them
+            for launch_key in LAUNCH_SPEC_ATTRIBUTES:
+                model_asg.pop(launch_key, None)
+        model_asg[key] = value['after']
+    if (replacing and module.params.get('replace_mode') == 'blue_green'):
+        purgeable = [instance['InstanceId'] for instance in blue_green_instances(model_asg, module)]
+        changed = changed or bool(purgeable)
+        plan.update({
+            'green_group': group_name + '-green',
+            'batch_count': 1 if purgeable else 0,
+            'peak_capacity': model_asg['DesiredCapacity'] + get_instance_index(model_asg).capacity(purgeable),
+            'purgeable_instances': purgeable,
+            'estimated_seconds': 2 * batch_seconds if purgeable else 0
+        })
+    elif (replacing):
+        model = PlanModel(model_asg)
+        model.settle()
+        # a checkpoint or an event queue would outlive the plan, and the model answers without any wait
+        plan_module = GroupModule(module, dict(module.params, checkpoint_file=None, event_queue_url=None,
+                                               progress_file=None, health_check_concurrency=1))
+        plan_module.asg_waiter = PlanWaiter(plan_module)
+        model_connection = AsgSnapshotCache(model)
+        try:
+            replace_changed, model_asg = replace(model_connection, model, model, plan_module)
+        except GroupFailure as e:
+            module.fail_json(msg="Could not plan the replacement of {0}: {1}".format(group_name,
+                                                                                     e.args[0].get('msg')))
+        changed = changed or replace_changed
+        plan.update({
+            'batches': model.batches,
+            'batch_count': len(model.batches),
+            'peak_capacity': model.peak_capacity,
+            'purgeable_instances': [instance_id for batch in model.batches for instance_id in batch['terminate']],
+            'api_calls': model.calls,
+            'api_call_count': sum(model.calls.values()),
+            'estimated_seconds': (len(model.batches) + 1) * batch_seconds if model.batches else 0
+        })
+    asg['plan'] = plan
+    return (changed, asg)
 
-    if (wait_timeout <= time.time()):
-        # waiting took too long
-        module.fail_json(msg="Waited too long for new instances to become viable. %s" % time.asctime())
-    log.debug("Reached viable_instances: {0}".format(desired_size))
-    return asg
 
+def get_retry_policy(module):
+    ''' The RetryPolicy, and with it the retry budget, every client of the
+        module run shares. '''
+    policy = getattr(module, 'asg_retry_policy', None)
+    if (policy is None):
+        policy = RetryPolicy(module.params.get('api_max_retries'), module.params.get('api_retry_budget'),
+                             module.params.get('api_retry_base_delay'), module.params.get('api_retry_max_delay'))
+        module.asg_retry_policy = policy
+    return policy
+
+
+def api_client(module, metrics, connection, service):
+    ''' Puts a boto3 client behind an ApiClient with its own rate limiter and
+        the run's retry policy. '''
+    limiter = None
+    if (module.params.get('api_rate_limit')):
+        limiter = TokenBucket(module.params.get('api_rate_limit'), module.params.get('api_burst'))
+    return ApiClient(connection, service, metrics, limiter, get_retry_policy(module))
+
+
+def wrap_connections(module, metrics, asg_connection, elb_connection, elb2_connection, ec2_connection,
+                     sqs_connection=None):
+    ''' Puts each boto3 client behind an api_client, and the autoscaling
+        client also behind the run's AsgSnapshotCache. An sqs client is only
+        needed for event_queue_url and ends up in the cache's EventStream. '''
+    clients = [api_client(module, metrics, connection, service) for service, connection in
+               (('autoscaling', asg_connection), ('elb', elb_connection), ('elbv2', elb2_connection),
+                ('ec2', ec2_connection))]
+    # one describe result per group and poll generation is shared by every consumer in this run
+    clients[0] = AsgSnapshotCache(clients[0])
+    if (sqs_connection is not None):
+        clients[0].events = EventStream(module, api_client(module, metrics, sqs_connection, 'sqs'))
+    return tuple(clients)
+
+
+def report_metrics(module, metrics):
+    ''' Returns the run's metrics for exit_json, also writing them to
+        metrics_file when one is set. '''
+    run_metrics = metrics.as_dict()
+    metrics_file = module.params.get('metrics_file')
+    if (metrics_file):
+        try:
+            with open(metrics_file, 'w') as f:
+                json.dump(run_metrics, f, indent=2, sort_keys=True)
+        except (IOError, OSError) as e:
+            module.warn("Could not write metrics to {0}: {1}".format(metrics_file, str(e)))
+    return run_metrics
 
-def main():
+
+def asg_argument_spec():
     argument_spec = ec2_argument_spec()
     argument_spec.update(
         dict(
-            name=dict(required=True, type='str'),
+            name=dict(type='str'),
+            groups=dict(type='list'),
+            group_concurrency=dict(type='int', default=4),
+            health_check_concurrency=dict(type='int', default=8),
             load_balancers=dict(type='list'),
             target_groups=dict(type='list'),
             availability_zones=dict(type='list'),
             launch_config_name=dict(type='str'),
+            launch_template=dict(type='dict'),
+            mixed_instances_policy=dict(type='dict'),
+            warm_pool=dict(type='dict'),
             min_size=dict(type='int'),
             max_size=dict(type='int'),
             desired_capacity=dict(type='int'),
             vpc_zone_identifier=dict(type='list'),
             replace_batch_size=dict(type='int', default=1),
+            replace_mode=dict(default='rolling', choices=['rolling', 'blue_green']),
+            replace_batch_mode=dict(default='fixed', choices=['fixed', 'adaptive']),
+            replace_batch_max_size=dict(type='int'),
+            replace_batch_max_percent=dict(type='int'),
+            replace_pipeline=dict(type='bool', default=False),
+            replace_max_surge=dict(type='int'),
+            checkpoint_file=dict(type='path'),
+            progress_file=dict(type='path'),
+            plan_batch_seconds=dict(type='int'),
             replace_all_instances=dict(type='bool', default=False),
             replace_instances=dict(type='list', default=[]),
             lc_check=dict(type='bool', default=True),
             wait_timeout=dict(type='int', default=300),
+            force_delete=dict(type='bool', default=False),
+            update_timeout=dict(type='int'),
+            wait_interval=dict(type='float', default=5),
+            wait_max_interval=dict(type='float', default=20),
+            wait_backoff=dict(type='float', default=1.5),
+            wait_jitter=dict(type='float', default=0.1),
+            event_queue_url=dict(type='str'),
+            event_fallback_interval=dict(type='float', default=300),
+            metrics_file=dict(type='path'),
+            metadata_cache_dir=dict(type='path'),
+            metadata_cache_ttl=dict(type='int', default=900),
+            api_rate_limit=dict(type='float', default=10),
+            api_burst=dict(type='int'),
+            api_max_retries=dict(type='int', default=8),
+            api_retry_budget=dict(type='int', default=200),
+            api_retry_base_delay=dict(type='float', default=0.5),
+            api_retry_max_delay=dict(type='float', default=20),
             state=dict(default='present', choices=['present', 'absent']),
             tags=dict(type='list'),
             health_check_period=dict(type='int', default=300),
@@ -984,45 +3435,69 @@ def main():
             ])
         ),
     )
+    return argument_spec
 
+
+def main():
+    argument_spec = asg_argument_spec()
     module = AnsibleModule(
         argument_spec=argument_spec,
-        mutually_exclusive=[['replace_all_instances', 'replace_instances']]
+        mutually_exclusive=[['replace_all_instances', 'replace_instances'], ['name', 'groups'],
+                            ['launch_config_name', 'launch_template']],
+        required_one_of=[['name', 'groups']],
+        supports_check_mode=True
     )
 
     if (not HAS_BOTO):
         module.fail_json(msg='boto3 required for this module')
+    if (module.params.get('event_queue_url') and not module.params.get('notification_topic')):
+        module.fail_json(msg="event_queue_url requires notification_topic")
 
-    state = module.params.get('state')
-    replace_instances = module.params.get('replace_instances')
-    replace_all_instances = module.params.get('replace_all_instances')
     region, ec2_url, aws_connect_params = get_aws_connection_info(module, boto3=True)
+    metrics = RunMetrics()
+    # ApiClient does all the retrying, botocore's own retries would multiply it
+    aws_connect_params['config'] = botocore.config.Config(retries={'max_attempts': 0})
+
+    def connect(resource):
+        return lambda: boto3_conn(module, conn_type="client", resource=resource, region=region, endpoint=ec2_url,
+                                  **aws_connect_params)
+
     try:
-        asg_connection = boto3_conn(module, conn_type="client", resource="autoscaling", region=region, endpoint=ec2_url,
-                                    **aws_connect_params)
-        elb_connection = boto3_conn(module, conn_type="client", resource="elb", region=region, endpoint=ec2_url,
-                                    **aws_connect_params)
-        elb2_connection = boto3_conn(module, conn_type="client", resource="elbv2", region=region, endpoint=ec2_url,
-                                     **aws_connect_params)
-        ec2_connection = boto3_conn(module, conn_type="client", resource="ec2", region=region, endpoint=ec2_url,
-                                    **aws_connect_params)
+        asg_connection = connect('autoscaling')()
+        # the other clients are only created once a run needs them
+        elb_connection = LazyClient(connect('elb'))
+        elb2_connection = LazyClient(connect('elbv2'))
+        ec2_connection = LazyClient(connect('ec2'))
+        identity = (aws_connect_params.get('aws_access_key_id') or aws_connect_params.get('profile_name') or
+                    os.environ.get('AWS_ACCESS_KEY_ID') or os.environ.get('AWS_PROFILE') or 'default')
+        module.asg_metadata = MetadataCache(module, region, '{0}@{1}'.format(identity, ec2_url or ''),
+                                            api_client(module, metrics, LazyClient(connect('sts')), 'sts'))
+        sqs_connection = None
+        if (module.params.get('event_queue_url')):
+            sqs_connection = boto3_conn(module, conn_type="client", resource="sqs", region=region, endpoint=ec2_url,
+                                        **aws_connect_params)
         if (not asg_connection):
             module.fail_json(msg="failed to connect to AWS for the given region: %s" % str(region))
     except botocore.exceptions.ClientError as e:
         module.fail_json(msg=str(e))
-    changed = create_changed = replace_changed = False
-
-    if (state == 'present'):
-        create_changed, asg_properties = create_autoscaling_group(asg_connection, ec2_connection, elb_connection,
-                                                                  elb2_connection, module)
-    elif (state == 'absent'):
-        changed = delete_autoscaling_group(asg_connection, module)
-        module.exit_json(changed=changed)
-    if (replace_all_instances or replace_instances):
-        replace_changed, asg_properties = replace(asg_connection, elb_connection, elb2_connection, module)
-    if (create_changed or replace_changed):
-        changed = True
-    module.exit_json(changed=changed, **asg_properties)
+    asg_connection, elb_connection, elb2_connection, ec2_connection = wrap_connections(
+        module, metrics, asg_connection, elb_connection, elb2_connection, ec2_connection, sqs_connection)
+
+    if (module.params.get('groups')):
+        changed, results = manage_groups(asg_connection, ec2_connection, elb_connection, elb2_connection, module)
+        run_metrics = report_metrics(module, metrics)
+        failed = [result['name'] for result in results if result['failed']]
+        if (failed):
+            module.fail_json(msg="Failed to manage {0} of {1} groups: {2}".format(len(failed), len(results),
+                                                                                 ", ".join(failed)),
+                             changed=changed, groups=results, metrics=run_metrics)
+        module.exit_json(changed=changed, groups=results, metrics=run_metrics)
+
+    changed, asg_properties = manage_group(asg_connection, ec2_connection, elb_connection, elb2_connection, module)
+    run_metrics = report_metrics(module, metrics)
+    if (asg_properties is None):
+        module.exit_json(changed=changed, metrics=run_metrics)
+    module.exit_json(changed=changed, metrics=run_metrics, **asg_properties)
 
 
 if (__name__ == '__main__'):